@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+#
+#  cache_benchmark.py - Cold versus warm open times of the track cache
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  Usage: benchmarks/cache_benchmark.py [POINTS ...]
+#
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from gpxviewer.cache import TrackCache
+from gpxviewer.reader import read_gpx
+
+from gpxgen import write_gpx
+
+
+def cold_open(filename, cache):
+    tracks = read_gpx(filename)
+    cache.put(filename, tracks)
+    return tracks
+
+
+def warm_open(filename, cache):
+    return cache.get(filename)
+
+
+def main(sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TrackCache(os.path.join(tmp, 'cache'))
+        print('%10s %10s %10s %8s' % ('points', 'cold [s]', 'warm [s]', 'speedup'))
+        for points in sizes:
+            filename = os.path.join(tmp, '%d.gpx' % points)
+            write_gpx(filename, points)
+
+            t0 = time.perf_counter()
+            cold_open(filename, cache)
+            cold = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            if warm_open(filename, cache) is None:
+                raise RuntimeError('cache miss for %s' % filename)
+            warm = time.perf_counter() - t0
+
+            print('%10d %10.3f %10.3f %7.1fx' % (points, cold, warm, cold / warm))
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [1000, 10000, 100000])
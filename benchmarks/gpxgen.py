@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+#  gpxgen.py - Synthetic GPX files for the GPX Viewer benchmarks
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  Usage: benchmarks/gpxgen.py FILE POINTS [--segments N] [--tracks N] [--seed N]
+#                              [--missing-time P] [--missing-ele P] [--zero-duration N]
+#
+#  The same arguments always give the same file, byte for byte, so results
+#  from different runs and machines measure the same input.
+#
+import sys
+import random
+import argparse
+from math import cos, sin
+from datetime import datetime, timezone
+
+START = datetime(2020, 5, 1, 8, 0, 0, tzinfo=timezone.utc).timestamp()
+
+# roughly a bike ride: a point every second, a few metres apart
+STEP_DEGREES = 5e-5
+
+
+def _isotime(t):
+    return datetime.fromtimestamp(t, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def write_gpx(filename, points, segments=1, tracks=1, seed=0,
+              missing_time=0.0, missing_ele=0.0, zero_duration=0):
+    # points are spread evenly over tracks * segments segments; the last
+    # zero_duration segments of every track give all their points the same
+    # timestamp. missing_time and missing_ele are the chance of a point
+    # lacking a <time> or <ele>.
+    rnd = random.Random(seed)
+    lat, lon, ele = 51.0, -1.0, 100.0
+    heading = rnd.uniform(0, 6.283)
+    t = START
+    total = tracks * segments
+    written = 0
+
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" creator="gpxgen" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        for ti in range(tracks):
+            f.write('<trk><name>synthetic %d</name>\n' % ti)
+            for si in range(segments):
+                n = (points * (ti * segments + si + 1)) // total - written
+                written += n
+                frozen = si >= segments - zero_duration
+                f.write('<trkseg>\n')
+                lines = []
+                for _ in range(n):
+                    heading += rnd.gauss(0, 0.2)
+                    step = STEP_DEGREES * rnd.uniform(0.2, 1.5)
+                    lat += step * cos(heading)
+                    lon += step * sin(heading) * 1.6
+                    ele += rnd.gauss(0, 0.5)
+                    if not frozen:
+                        t += 1
+                    line = '<trkpt lat="%.7f" lon="%.7f">' % (lat, lon)
+                    if rnd.random() >= missing_ele:
+                        line += '<ele>%.1f</ele>' % ele
+                    if rnd.random() >= missing_time:
+                        line += '<time>%s</time>' % _isotime(t)
+                    lines.append(line + '</trkpt>\n')
+                    if len(lines) >= 10000:
+                        f.writelines(lines)
+                        lines = []
+                f.writelines(lines)
+                f.write('</trkseg>\n')
+                # a pause between segments
+                t += 600
+            f.write('</trk>\n')
+            # the next track starts a day later
+            t += 86400
+        f.write('</gpx>\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='gpxgen.py')
+    parser.add_argument('file')
+    parser.add_argument('points', type=int)
+    parser.add_argument('--segments', type=int, default=1, help='segments per track')
+    parser.add_argument('--tracks', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--missing-time', type=float, default=0.0, metavar='P',
+                        help='chance of a point without a timestamp')
+    parser.add_argument('--missing-ele', type=float, default=0.0, metavar='P',
+                        help='chance of a point without an elevation')
+    parser.add_argument('--zero-duration', type=int, default=0, metavar='N',
+                        help='segments per track whose points all share one timestamp')
+    args = parser.parse_args(argv)
+    write_gpx(args.file, args.points, args.segments, args.tracks, args.seed,
+              args.missing_time, args.missing_ele, args.zero_duration)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
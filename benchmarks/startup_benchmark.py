@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+#  startup_benchmark.py - Import time and time to first frame of GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  Usage: benchmarks/startup_benchmark.py [--runs N] [--max-import S] [--max-show S]
+#
+#  Every measurement runs in a fresh interpreter. Showing the window needs a
+#  display; under CI run it with xvfb-run. Exits with status 1 when a median
+#  exceeds the given limit, so it can guard against regressions.
+#
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+IMPORT_SCRIPT = """
+import sys, time, json
+t0 = time.perf_counter()
+import gpxviewer.ui
+t1 = time.perf_counter()
+heavy = [m for m in ('matplotlib', 'gpxpy', 'gpxviewer.stats') if m in sys.modules]
+print(json.dumps({'import': t1 - t0, 'heavy': heavy}))
+"""
+
+SHOW_SCRIPT = """
+import sys, time, json
+t0 = time.perf_counter()
+from gi.repository import Gtk
+from gpxviewer.ui import MainWindow
+gui = MainWindow(ui_dir=%(ui_dir)r, files=[])
+t1 = time.perf_counter()
+times = {'show': t1 - t0}
+
+def on_draw(*args):
+    times.setdefault('first_frame', time.perf_counter() - t0)
+    Gtk.main_quit()
+
+gui.mainWindow.connect_after('draw', on_draw)
+Gtk.main()
+print(json.dumps(times))
+"""
+
+
+def run(script):
+    out = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import', type=float, help='fail if the median import time exceeds this')
+    parser.add_argument('--max-show', type=float, help='fail if the median time to show exceeds this')
+    parser.add_argument('--no-window', action='store_true', help='only measure the import')
+    args = parser.parse_args()
+
+    failed = False
+    imports = [run(IMPORT_SCRIPT) for _ in range(args.runs)]
+    median = statistics.median(r['import'] for r in imports)
+    print('import gpxviewer.ui      %.3f s (median of %d)' % (median, args.runs))
+    if imports[0]['heavy']:
+        print('  imported at startup: %s' % ', '.join(imports[0]['heavy']))
+        failed = True
+    if args.max_import is not None and median > args.max_import:
+        failed = True
+
+    if not args.no_window:
+        ui_dir = os.path.join(os.path.abspath(ROOT), 'ui') + os.sep
+        shows = [run(SHOW_SCRIPT % {'ui_dir': ui_dir}) for _ in range(args.runs)]
+        median = statistics.median(r['show'] for r in shows)
+        print('mainWindow.show()        %.3f s (median of %d)' % (median, args.runs))
+        print('first frame drawn        %.3f s' % statistics.median(r['first_frame'] for r in shows))
+        if args.max_show is not None and median > args.max_show:
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+#
+#  suite.py - Benchmarks of loading, drawing and selecting tracks in GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  Usage: benchmarks/suite.py [-o results.json] [--compare old.json] [--max-points N]
+#                             [--repeat N] [--data-dir DIR] [--mock-map] [SCENARIO ...]
+#
+#  Every scenario is a synthetic file from gpxgen.py, written to the data
+#  dir once and reused. Results are written as JSON; --compare prints the
+#  ratio of every median to the one in an earlier results file.
+#
+#  No display is needed: the map is a stand-in that only collects tracks,
+#  and OsmGpsMap itself is replaced by a mock when it isn't installed (or
+#  with --mock-map), so drawing measures the work done on our side.
+#
+import os
+import sys
+import json
+import time
+import types
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+import numpy
+
+from gpxgen import write_gpx
+
+# name, points, segments, tracks, missing_time, missing_ele, zero_duration
+SCENARIOS = [
+    ('1k', 1000, 1, 1, 0.0, 0.0, 0),
+    ('10k', 10000, 1, 1, 0.0, 0.0, 0),
+    ('100k', 100000, 1, 1, 0.0, 0.0, 0),
+    ('1M', 1000000, 1, 1, 0.0, 0.0, 0),
+    ('5M', 5000000, 1, 1, 0.0, 0.0, 0),
+    ('100k-100-segments', 100000, 100, 1, 0.0, 0.0, 0),
+    ('100k-50-tracks', 100000, 1, 50, 0.0, 0.0, 0),
+    ('100k-sparse', 100000, 4, 1, 0.3, 0.5, 0),
+    ('10k-zero-duration', 10000, 10, 1, 0.0, 0.0, 5),
+]
+
+# pseudo tracks added to the statistics, more than anyone loads at once
+STATISTICS_TRACKS = 20000
+CLICKS = 200
+CLICK_TOLERANCE_PX = 8
+
+
+class _MockMapTrack:
+    def __init__(self):
+        self.points = []
+        self.color = None
+        self.props = types.SimpleNamespace(alpha=1.0)
+
+    def set_color(self, color):
+        self.color = color
+
+    def add_point(self, point):
+        self.points.append(point)
+
+
+def _mock_osmgpsmap():
+    module = types.ModuleType('gi.repository.OsmGpsMap')
+    module.MapTrack = _MockMapTrack
+    module.MapPoint = types.SimpleNamespace(new_degrees=lambda lat, lon: (lat, lon))
+    return module
+
+
+def install_osmgpsmap(mock):
+    if not mock:
+        try:
+            import gi
+            gi.require_version('OsmGpsMap', '1.0')
+            from gi.repository import OsmGpsMap  # noqa: F401
+            return False
+        except (ImportError, ValueError):
+            pass
+    if 'gi' not in sys.modules:
+        try:
+            import gi  # noqa: F401
+        except ImportError:
+            gi = sys.modules['gi'] = types.ModuleType('gi')
+            gi.repository = sys.modules['gi.repository'] = types.ModuleType('gi.repository')
+    sys.modules['gi.repository.OsmGpsMap'] = sys.modules['gi.repository'].OsmGpsMap = _mock_osmgpsmap()
+    return True
+
+
+class FakeMap:
+    # the parts of OsmGpsMap.Map that TrackDrawing uses
+    def __init__(self, zoom):
+        self.props = types.SimpleNamespace(zoom=zoom)
+        self.tracks = set()
+
+    def track_add(self, track):
+        self.tracks.add(track)
+
+    def track_remove(self, track):
+        self.tracks.discard(track)
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def bench_parse(filename):
+    from gpxviewer.reader import read_gpx
+    return lambda: read_gpx(filename)
+
+
+def bench_summary(tracks):
+    from gpxviewer.summary import summarize
+    return lambda: [summarize(t) for t in tracks]
+
+
+def bench_simplify(tracks):
+    from gpxviewer import simplify
+    return lambda: [simplify.rank(s.lat, s.lon) for t in tracks for s in t.segments]
+
+
+def bench_draw(tracks, zoom):
+    from gpxviewer.drawing import TrackDrawing
+    color = object()
+
+    def run():
+        map_ = FakeMap(zoom)
+        for track in tracks:
+            drawing = TrackDrawing(map_, track, color)
+            drawing.set_visible(True)
+            drawing.set_visible(False)
+    return run
+
+
+def bench_select(tracks, zoom):
+    # what MainWindow.find_drawing_at does for a click, at points on and
+    # next to the tracks
+    from gpxviewer import spatial, simplify
+    from gpxviewer.drawing import TrackDrawing
+
+    map_ = FakeMap(zoom)
+    index = spatial.BoxIndex()
+    drawings = []
+    for track in tracks:
+        drawing = TrackDrawing(map_, track, None)
+        drawing.level = simplify.level(zoom)
+        index.insert(drawing, spatial.segment_boxes(track))
+        drawings.append(drawing)
+
+    rnd = random.Random(0)
+    clicks = []
+    for _ in range(CLICKS):
+        segment = rnd.choice(rnd.choice(tracks).segments)
+        if len(segment):
+            i = rnd.randrange(len(segment))
+            clicks.append((segment.lat[i] + rnd.uniform(-1e-4, 1e-4), segment.lon[i] + rnd.uniform(-1e-4, 1e-4)))
+
+    scale = 2 ** zoom
+    # degrees per CLICK_TOLERANCE_PX at the equator, close enough here
+    d = CLICK_TOLERANCE_PX * 360 / (simplify.TILE_SIZE * scale)
+
+    def run():
+        for lat, lon in clicks:
+            cx, cy = simplify.project(lat, lon)
+            cx, cy = cx * scale, cy * scale
+            best, best_distance = None, CLICK_TOLERANCE_PX
+            for drawing in index.intersecting(lat - d, lon - d, lat + d, lon + d):
+                for segment in drawing.track.segments:
+                    xs, ys = simplify.project(*drawing.segment_points(segment))
+                    dist = spatial.polyline_distance(cx, cy, xs * scale, ys * scale)
+                    if dist <= best_distance:
+                        best, best_distance = drawing, dist
+    return run
+
+
+def bench_statistics(tracks):
+    from gpxviewer.aggregates import TrackStatistics
+    summaries = [t.summary for t in tracks]
+    day = 86400
+    pseudo = []
+    for i in range(STATISTICS_TRACKS):
+        s = summaries[i % len(summaries)]
+        start = s.start_time - (i * day / 3) if s.start_time is not None else None
+        pseudo.append(s._replace(start_time=start))
+
+    def run():
+        st = TrackStatistics()
+        for i, s in enumerate(pseudo):
+            st.add(i, s)
+        st.weeks(), st.months(), st.years(), st.average_speeds()
+        for i in range(0, len(pseudo), 2):
+            st.remove(i)
+        st.weeks(), st.months(), st.years(), st.average_speeds()
+    return run
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, check=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def scenario_file(data_dir, scenario):
+    name, points, segments, tracks, missing_time, missing_ele, zero_duration = scenario
+    filename = os.path.join(data_dir, '%s.gpx' % name)
+    if not os.path.exists(filename):
+        write_gpx(filename + '.tmp', points, segments, tracks, 0, missing_time, missing_ele, zero_duration)
+        os.replace(filename + '.tmp', filename)
+    return filename
+
+
+def run_scenario(scenario, data_dir, repeat):
+    from gpxviewer.reader import read_gpx
+
+    name, points = scenario[:2]
+    filename = scenario_file(data_dir, scenario)
+    tracks = read_gpx(filename)
+    for track in tracks:
+        for segment in track.segments:
+            segment.rank
+
+    benchmarks = [
+        ('parse', bench_parse(filename)),
+        ('summary', bench_summary(tracks)),
+        ('simplify', bench_simplify(tracks)),
+        ('draw-zoom-10', bench_draw(tracks, 10)),
+        ('draw-full', bench_draw(tracks, 20)),
+        ('select-zoom-14', bench_select(tracks, 14)),
+        ('statistics', bench_statistics(tracks)),
+    ]
+    for benchmark, fn in benchmarks:
+        times = timed(fn, repeat)
+        yield {
+            'scenario': name,
+            'benchmark': benchmark,
+            'points': points,
+            'times': times,
+            'min': min(times),
+            'median': statistics.median(times),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='suite.py')
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help='run only these (%s)' % ', '.join(s[0] for s in SCENARIOS))
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='results file of an earlier run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-points', type=int, default=1000000,
+                        help='skip larger scenarios unless named (default: %(default)s)')
+    parser.add_argument('--data-dir', help='keep the generated files here between runs')
+    parser.add_argument('--mock-map', action='store_true', help='mock OsmGpsMap even when it is installed')
+    args = parser.parse_args(argv)
+
+    known = {s[0]: s for s in SCENARIOS}
+    for name in args.scenarios:
+        if name not in known:
+            parser.error('unknown scenario %s' % name)
+    scenarios = [known[n] for n in args.scenarios] or [s for s in SCENARIOS if s[1] <= args.max_points]
+
+    mocked = install_osmgpsmap(args.mock_map)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['scenario'], r['benchmark']): r['median'] for r in json.load(f)['results']}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        print('%-20s %-16s %10s %10s %8s' % ('scenario', 'benchmark', 'median [s]', 'min [s]', 'change'))
+        for scenario in scenarios:
+            for r in run_scenario(scenario, data_dir, args.repeat):
+                results.append(r)
+                old = baseline.get((r['scenario'], r['benchmark']))
+                change = '%7.2fx' % (r['median'] / old) if old else ''
+                print('%-20s %-16s %10.4f %10.4f %8s' % (r['scenario'], r['benchmark'], r['median'], r['min'], change))
+                sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                    'revision': git_revision(),
+                    'python': platform.python_version(),
+                    'numpy': numpy.__version__,
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                    'mock_osmgpsmap': mocked,
+                    'repeat': args.repeat,
+                },
+                'results': results,
+            }, f, indent=1)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+#  tile_server.py - A local stand-in for a map tile server
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  Usage: benchmarks/tile_server.py [--port N] [--delay S] [--fail P]
+#
+#  Serves a plain 256x256 PNG for every /<z>/<x>/<y>.png, after delay
+#  seconds, failing a share fail of the requests. Point GPX Viewer at it
+#  with GPXVIEWER_TILE_URL=http://localhost:8000/#Z/#X/#Y.png to try tile
+#  seeding without touching a real server. On exit it prints how many
+#  tiles were served and the most connections seen at once.
+#
+import sys
+import time
+import zlib
+import random
+import struct
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def png(width, height, rgb):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    row = b'\0' + bytes(rgb) * width
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(row * height)) +
+            chunk(b'IEND', b''))
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.most_active = 0
+        self.served = 0
+
+
+def make_handler(args, stats):
+    tile = png(256, 256, (0xe0, 0xe0, 0xd0))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with stats.lock:
+                stats.active += 1
+                stats.most_active = max(stats.most_active, stats.active)
+            try:
+                parts = self.path.lstrip('/').rsplit('.', 1)[0].split('/')
+                if len(parts) != 3 or not all(p.isdigit() for p in parts):
+                    self.send_error(404)
+                    return
+                time.sleep(args.delay)
+                if random.random() < args.fail:
+                    self.send_error(503)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(tile)))
+                self.end_headers()
+                self.wfile.write(tile)
+                with stats.lock:
+                    stats.served += 1
+            finally:
+                with stats.lock:
+                    stats.active -= 1
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tile_server.py')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds before each answer')
+    parser.add_argument('--fail', type=float, default=0.0, metavar='P', help='share of requests answered 503')
+    args = parser.parse_args(argv)
+
+    stats = Stats()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args, stats))
+    print('serving tiles on http://127.0.0.1:%d/#Z/#X/#Y.png' % args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('%d tiles served, at most %d connections at once' % (stats.served, stats.most_active))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
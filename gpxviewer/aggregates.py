@@ -0,0 +1,112 @@
+#
+#  aggregates.py - Running totals over the loaded tracks for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+from datetime import datetime
+
+
+class _Total:
+    __slots__ = ('distance', 'moving_time', 'tracks')
+
+    def __init__(self):
+        self.distance = 0.
+        self.moving_time = 0.
+        self.tracks = 0
+
+
+class TrackStatistics:
+    # Per (ISO year, ISO week), (year, month) and year totals of the loaded
+    # tracks, kept up to date as tracks are added and removed so that
+    # nothing has to walk the tracks when the statistics are shown.
+
+    def __init__(self):
+        self._weeks = {}
+        self._months = {}
+        self._years = {}
+        # track -> (bins, summary), in the order the tracks were added
+        self._tracks = {}
+        # bumped on every change, so views can tell when to redraw
+        self.version = 0
+
+    def __len__(self):
+        return len(self._tracks)
+
+    @staticmethod
+    def _bins(summary):
+        if summary.start_time is None:
+            return ()
+        start = datetime.fromtimestamp(summary.start_time)
+        iso_year, iso_week, _ = start.isocalendar()
+        return ((iso_year, iso_week), (start.year, start.month), start.year)
+
+    def _update(self, bins, summary, sign):
+        for table, key in zip((self._weeks, self._months, self._years), bins):
+            total = table.get(key)
+            if total is None:
+                total = table[key] = _Total()
+            total.distance += sign * summary.moving_distance
+            total.moving_time += sign * summary.moving_time
+            total.tracks += sign
+            if not total.tracks:
+                del table[key]
+
+    def add(self, track, summary=None):
+        if track in self._tracks:
+            return
+        summary = summary or track.summary
+        bins = self._bins(summary)
+        self._tracks[track] = (bins, summary)
+        self._update(bins, summary, 1)
+        self.version += 1
+
+    def remove(self, track):
+        entry = self._tracks.pop(track, None)
+        if entry is None:
+            return
+        self._update(entry[0], entry[1], -1)
+        self.version += 1
+
+    @staticmethod
+    def _sorted(table):
+        return [(key, table[key].distance, table[key].moving_time, table[key].tracks)
+                for key in sorted(table)]
+
+    # each returns [(key, distance, moving_time, tracks), ...] sorted by key
+    def weeks(self):
+        return self._sorted(self._weeks)
+
+    def months(self):
+        return self._sorted(self._months)
+
+    def years(self):
+        return self._sorted(self._years)
+
+    def average_speeds(self):
+        return [get_average_speed(summary) for _, summary in self._tracks.values()]
+
+
+def get_average_speed(summary):
+    # 9.8.2011 Hadmut Danisch hadmut@danisch.de:
+    # duration can become 0 in special cases and thus cause division by zero
+    dis = summary.moving_distance
+    dur = summary.moving_time
+    if dur == 0:
+        return 0
+    return dis / dur
@@ -0,0 +1,173 @@
+#
+#  archive.py - Reading GPX out of compressed files and archives
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  A file inside a zip or tar archive is named by the path of the archive
+#  followed by the name of the member, as in tracks.zip/2009/walk.gpx, so
+#  it can go wherever a filename goes: the loader, the track cache and
+#  memory.TrackMemory reloading it. Everything is read as a stream,
+#  nothing is extracted to disk.
+#
+import os
+import bz2
+import gzip
+import zlib
+import lzma
+import tarfile
+import zipfile
+import functools
+import contextlib
+
+COMPRESSORS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar',)
+COMPRESSED_TAR_SUFFIXES = ('.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+GPX_SUFFIXES = ('.gpx',) + tuple('.gpx' + s for s in COMPRESSORS)
+
+# for file choosers
+PATTERNS = ['*' + s for s in GPX_SUFFIXES + ZIP_SUFFIXES + TAR_SUFFIXES + COMPRESSED_TAR_SUFFIXES]
+
+# what broken archives and compressed files raise besides OSError; zlib
+# is behind gzip streams and deflated zip members
+ERRORS = (zipfile.BadZipFile, tarfile.TarError, lzma.LZMAError, zlib.error, EOFError)
+# tar archives whose members a process has listed, see _tar_members
+TAR_INDEXES = 8
+
+
+def is_gpx(name):
+    return name.lower().endswith(GPX_SUFFIXES)
+
+
+def is_archive(name):
+    return name.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES + COMPRESSED_TAR_SUFFIXES)
+
+
+def is_compressed_tar(name):
+    return name.lower().endswith(COMPRESSED_TAR_SUFFIXES)
+
+
+def split(path):
+    # (archive, member name) for a file inside an archive, else (path, None)
+    start = 0
+    while True:
+        i = path.find(os.sep, start)
+        if i < 0:
+            return path, None
+        head = path[:i]
+        if head and is_archive(head) and os.path.isfile(head):
+            return head, path[i + 1:].replace(os.sep, '/')
+        start = i + 1
+
+
+def stat(path):
+    # the stat of the file path is in, for telling whether it has changed
+    return os.stat(split(path)[0])
+
+
+def members(filename):
+    # the GPX files in a zip or uncompressed tar archive. Their members can
+    # be read independently of each other, so each can go to another worker;
+    # a compressed tar is a single stream and has to be read from the start
+    if filename.lower().endswith(ZIP_SUFFIXES):
+        with zipfile.ZipFile(filename) as z:
+            return [i.filename for i in z.infolist() if not i.is_dir() and is_gpx(i.filename)]
+    with tarfile.open(filename, 'r:') as t:
+        return [m.name for m in t.getmembers() if m.isfile() and is_gpx(m.name)]
+
+
+def expand(filenames):
+    # filenames with splittable archives replaced by their members. Archives
+    # that can't be listed are kept, reading them reports the error
+    expanded = []
+    for filename in filenames:
+        if is_archive(filename) and not is_compressed_tar(filename):
+            try:
+                names = members(filename)
+            except (OSError,) + ERRORS:
+                names = None
+            if names:
+                expanded.extend(os.path.join(filename, name) for name in names)
+                continue
+        expanded.append(filename)
+    return expanded
+
+
+def _tar_members(filename):
+    # name -> TarInfo of every member. A tar has no index, finding one
+    # member reads every header before it, so each process lists an
+    # archive once for all the members it is given
+    st = os.stat(filename)
+    return _tar_index(filename, st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=TAR_INDEXES)
+def _tar_index(filename, mtime, size):
+    with tarfile.open(filename) as t:
+        return {m.name: m for m in t.getmembers()}
+
+
+def _decompressed(stack, f, name):
+    for suffix, open_ in COMPRESSORS.items():
+        if name.lower().endswith(suffix):
+            return stack.enter_context(open_(f))
+    return f
+
+
+@contextlib.contextmanager
+def open_gpx(path):
+    # a binary stream of the GPX document at path, decompressed
+    archive, member = split(path)
+    with contextlib.ExitStack() as stack:
+        try:
+            if member is None:
+                f = stack.enter_context(open(path, 'rb'))
+            elif archive.lower().endswith(ZIP_SUFFIXES):
+                z = stack.enter_context(zipfile.ZipFile(archive))
+                f = stack.enter_context(z.open(member))
+            else:
+                info = _tar_members(archive)[member]
+                t = stack.enter_context(tarfile.open(archive))
+                f = t.extractfile(info)
+                if f is None:
+                    raise KeyError(member)
+                stack.enter_context(f)
+        except KeyError:
+            # the member is gone from the archive
+            raise FileNotFoundError(path) from None
+        yield _decompressed(stack, f, member or path)
+
+
+def streams(filename):
+    # (member name, binary stream) for the GPX files of an archive, read in
+    # one pass. Each stream is only valid until the next is produced
+    if filename.lower().endswith(ZIP_SUFFIXES):
+        with zipfile.ZipFile(filename) as z:
+            for i in z.infolist():
+                if not i.is_dir() and is_gpx(i.filename):
+                    with contextlib.ExitStack() as stack:
+                        f = stack.enter_context(z.open(i))
+                        yield i.filename, _decompressed(stack, f, i.filename)
+        return
+    with tarfile.open(filename, 'r|*') as t:
+        for m in t:
+            if m.isfile() and is_gpx(m.name):
+                with contextlib.ExitStack() as stack:
+                    f = stack.enter_context(t.extractfile(m))
+                    yield m.name, _decompressed(stack, f, m.name)
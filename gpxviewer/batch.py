@@ -0,0 +1,178 @@
+#
+#  batch.py - Headless statistics over many GPX files
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Needs neither GTK nor a display, so nothing here may import gi.
+#
+import os
+import sys
+import csv
+import glob
+import json
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from .reader import read_gpx, GPXReadError
+from .aggregates import TrackStatistics, get_average_speed
+from . import archive
+
+GPX_EXTENSIONS = archive.GPX_SUFFIXES
+
+TRACK_FIELDS = ['file', 'track', 'name', 'points', 'distance_km', 'maximum_speed', 'average_speed',
+                'duration_s', 'start_time', 'end_time', 'moving_distance', 'moving_time']
+TOTAL_FIELDS = ['period', 'distance_km', 'moving_time', 'tracks', 'average_speed']
+
+
+def find_files(args):
+    for arg in args:
+        if os.path.isdir(arg):
+            for dirpath, dirnames, filenames in os.walk(arg):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(GPX_EXTENSIONS):
+                        yield os.path.join(dirpath, filename)
+        elif glob.has_magic(arg):
+            for filename in sorted(glob.glob(arg, recursive=True)):
+                if os.path.isfile(filename):
+                    yield from archive.expand([filename])
+        else:
+            # zip and tar archives given by name are read member by member
+            yield from archive.expand([arg])
+
+
+def positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError('%r is not a positive whole number' % text)
+    return value
+
+
+def _isotime(t):
+    return datetime.fromtimestamp(t).astimezone().isoformat() if t is not None else None
+
+
+def summarize_file(filename):
+    # runs in a worker process, returns (filename, [summary, ...], error)
+    try:
+        tracks = read_gpx(filename)
+    except (GPXReadError, EnvironmentError) as e:
+        return filename, None, str(e) or e.__class__.__name__
+    return filename, [(t.name, len(t), t.summary) for t in tracks], None
+
+
+def track_record(filename, index, name, points, summary):
+    # the figures shown in the sidebar of the main window
+    return {
+        'file': filename,
+        'track': index,
+        'name': name,
+        'points': points,
+        'distance_km': round(summary.moving_distance / 1000, 2),
+        'maximum_speed': summary.max_speed,
+        'average_speed': get_average_speed(summary),
+        'duration_s': summary.moving_time,
+        'start_time': _isotime(summary.start_time),
+        'end_time': _isotime(summary.end_time),
+        'moving_distance': summary.moving_distance,
+        'moving_time': summary.moving_time,
+    }
+
+
+def total_records(statistics, period):
+    totals = {'week': statistics.weeks, 'month': statistics.months, 'year': statistics.years}[period]()
+    for key, distance, moving_time, tracks in totals:
+        if period == 'week':
+            label = '%d-W%02d' % key
+        elif period == 'month':
+            label = '%d-%02d' % key
+        else:
+            label = '%d' % key
+        yield {
+            'period': label,
+            'distance_km': distance / 1000,
+            'moving_time': moving_time,
+            'tracks': tracks,
+            'average_speed': distance / moving_time if moving_time else 0,
+        }
+
+
+class _Writer:
+    def __init__(self, out, fmt, fields):
+        self.out = out
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(out, fields, lineterminator='\n')
+            self.csv.writeheader()
+        else:
+            self.csv = None
+
+    def write(self, record):
+        if self.csv:
+            self.csv.writerow(record)
+        else:
+            self.out.write(json.dumps(record) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='gpxviewer-stats',
+        description='Compute GPX Viewer track statistics without a display.')
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='GPX files, directories to search or glob patterns')
+    parser.add_argument('-f', '--format', choices=('csv', 'jsonl'), default='csv')
+    parser.add_argument('-r', '--report', choices=('tracks', 'week', 'month', 'year'), default='tracks',
+                        help='one row per track (streamed as files finish), or totals per period')
+    parser.add_argument('-j', '--jobs', type=positive_int, default=os.cpu_count() or 1,
+                        help='worker processes (default: number of cores)')
+    parser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args(argv)
+
+    files = list(find_files(args.paths))
+    writer = _Writer(args.output, args.format, TRACK_FIELDS if args.report == 'tracks' else TOTAL_FIELDS)
+    statistics = TrackStatistics()
+    errors = 0
+
+    # hand out files in chunks so per-task overhead doesn't limit scaling
+    chunksize = max(1, min(64, len(files) // (args.jobs * 8)))
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for filename, tracks, error in executor.map(summarize_file, files, chunksize=chunksize):
+            if error is not None:
+                errors += 1
+                sys.stderr.write('%s: %s\n' % (filename, error))
+                continue
+            for index, (name, points, summary) in enumerate(tracks):
+                if args.report == 'tracks':
+                    writer.write(track_record(filename, index, name, points, summary))
+                else:
+                    statistics.add((filename, index), summary)
+            args.output.flush()
+
+    if args.report != 'tracks':
+        for record in total_records(statistics, args.report):
+            writer.write(record)
+
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
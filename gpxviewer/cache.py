@@ -0,0 +1,222 @@
+#
+#  cache.py - On-disk cache of parsed tracks for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import os
+import sys
+import json
+import struct
+import hashlib
+import tempfile
+
+import numpy
+
+from .reader import Track, Segment
+from . import archive
+from .summary import TrackSummary
+
+# Each entry is MAGIC, a little endian uint32 header length, a JSON header
+# and then, for every segment, the latitude, longitude, elevation and time
+# arrays as native float64 followed by the simplification ranks as native
+# float32. Missing elevations and times are stored as NaN.
+MAGIC = b'GPXVIEWER-TRACKS\x02'
+SUFFIX = '.trk'
+# next to each, the dedup.content_digest of the file as a JSON object
+DIGEST_SUFFIX = '.digest'
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+class TrackCache:
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def _entry(self, filename, suffix=SUFFIX):
+        key = hashlib.sha1(os.path.abspath(filename).encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    @staticmethod
+    def stamp(filename):
+        # what an entry is checked against, see put
+        st = archive.stat(filename)
+        return st.st_size, st.st_mtime_ns
+
+    def get(self, filename):
+        # returns the list of tracks, or None if the file is not cached or
+        # has changed since it was cached
+        entry = self._entry(filename)
+        try:
+            size, mtime = self.stamp(filename)
+            with open(entry, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError
+                header_len, = struct.unpack('<I', f.read(4))
+                header = json.loads(f.read(header_len).decode('utf-8'))
+                if (header['path'] != os.path.abspath(filename) or header['size'] != size
+                        or header['mtime'] != mtime or header['byteorder'] != sys.byteorder):
+                    raise ValueError
+                tracks = self._read_tracks(f, header['tracks'])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, EOFError, struct.error):
+            self._remove(entry)
+            return None
+
+        # the modification time of an entry is its last use, for eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return tracks
+
+    def put(self, filename, tracks, stamp=None):
+        # stamp is stamp(filename) from before the file was read; nothing
+        # is stored if it has changed since, as the tracks may be stale
+        current = self.stamp(filename)
+        if stamp is not None and stamp != current:
+            return
+        size, mtime = current
+        header = {
+            'path': os.path.abspath(filename),
+            'size': size,
+            'mtime': mtime,
+            'byteorder': sys.byteorder,
+            'tracks': [],
+        }
+        arrays = []
+        for track in tracks:
+            header['tracks'].append({
+                'name': track.name,
+                'summary': track.summary._asdict(),
+                'segments': [len(segment) for segment in track.segments],
+            })
+            for segment in track.segments:
+                arrays.extend((segment.lat, segment.lon, segment.ele, segment.time, segment.rank))
+
+        os.makedirs(self.directory, exist_ok=True)
+        data = json.dumps(header).encode('utf-8')
+        # write to a temporary file first, several workers may be storing
+        # the same entry at once
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(MAGIC)
+                f.write(struct.pack('<I', len(data)))
+                f.write(data)
+                for a in arrays:
+                    a.tofile(f)
+            os.replace(tmp, self._entry(filename))
+        except OSError:
+            self._remove(tmp)
+
+    def get_digest(self, filename):
+        # the content digest stored by put_digest, None if there is none
+        # or the file has changed since
+        entry = self._entry(filename, DIGEST_SUFFIX)
+        try:
+            size, mtime = self.stamp(filename)
+            with open(entry, 'rb') as f:
+                header = json.loads(f.read().decode('utf-8'))
+            if (header['path'] != os.path.abspath(filename) or header['size'] != size
+                    or header['mtime'] != mtime):
+                raise ValueError
+            digest = header['digest']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            self._remove(entry)
+            return None
+
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return digest
+
+    def put_digest(self, filename, digest, stamp):
+        # like put, stamp is from before the file was hashed
+        size, mtime = current = self.stamp(filename)
+        if stamp != current:
+            return
+        data = json.dumps({'path': os.path.abspath(filename), 'size': size, 'mtime': mtime,
+                           'digest': digest}).encode('utf-8')
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._entry(filename, DIGEST_SUFFIX))
+        except OSError:
+            self._remove(tmp)
+
+    def trim(self):
+        # evict least recently used entries until the cache fits max_size
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    if not e.name.endswith((SUFFIX, DIGEST_SUFFIX)):
+                        continue
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, e.path))
+                    total += st.st_size
+        except FileNotFoundError:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        max_size, self.max_size = self.max_size, 0
+        self.trim()
+        self.max_size = max_size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _read_tracks(f, track_headers):
+        tracks = []
+        for th in track_headers:
+            segments = []
+            for n in th['segments']:
+                arrays = [numpy.fromfile(f, dtype=numpy.float64, count=n) for _ in range(4)]
+                arrays.append(numpy.fromfile(f, dtype=numpy.float32, count=n))
+                if any(len(a) != n for a in arrays):
+                    raise EOFError
+                segments.append(Segment(*arrays))
+            summary = th['summary']
+            for k in ('center', 'bounds'):
+                if summary[k] is not None:
+                    summary[k] = tuple(summary[k])
+            tracks.append(Track(th['name'], segments, TrackSummary(**summary)))
+        return tracks
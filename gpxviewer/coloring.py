@@ -0,0 +1,134 @@
+#
+#  coloring.py - Coloring tracks by speed or gradient
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Needs neither GTK nor a display, so nothing here may import gi.
+#
+from collections import namedtuple
+from colorsys import hsv_to_rgb
+
+import numpy
+
+from .summary import haversine, segment_distances
+
+SPEED = 'speed'
+GRADIENT = 'gradient'
+
+# colors from the lowest values to the highest, and missing for legs
+# without a value, such as the speed of untimed points. Any objects
+# MapTrack.set_color takes, the UI turns these into Gdk.RGBA
+Palette = namedtuple('Palette', ['colors', 'missing'])
+# (red, green, blue), blue through green to red
+PALETTE = Palette(tuple(hsv_to_rgb(2 / 3 * (1 - i / 7), 1.0, 0.9) for i in range(8)), (0.5, 0.5, 0.5))
+# a segment is drawn as at most this many runs of one color, each a
+# MapTrack of its own
+MAX_RUNS = 32
+# the values at these percentiles of a track get the ends of the palette,
+# so a few GPS errors don't squeeze everything else into one color
+LOW_PERCENTILE = 5
+HIGH_PERCENTILE = 95
+
+
+def leg_values(segment, mode):
+    # the speed in m/s or the gradient in percent of every leg between
+    # two points of segment, NaN where there is nothing to go by
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if mode == SPEED:
+            seconds = numpy.diff(segment.time)
+            return numpy.where(seconds > 0, segment_distances(segment) / seconds, numpy.nan)
+        flat = haversine(segment.lat[:-1], segment.lon[:-1], segment.lat[1:], segment.lon[1:])
+        return numpy.where(flat > 0, numpy.diff(segment.ele) / flat * 100, numpy.nan)
+
+
+def value_range(values, mode):
+    # the values given the lowest and highest colors, from the leg values
+    # of every segment of a track. Gradients are centred on flat
+    values = numpy.concatenate(list(values) or [[]])
+    values = values[~numpy.isnan(values)]
+    if not len(values):
+        return 0., 0.
+    low, high = numpy.percentile(values, [LOW_PERCENTILE, HIGH_PERCENTILE])
+    if mode == GRADIENT:
+        high = max(abs(low), abs(high))
+        low = -high
+    return float(low), float(high)
+
+
+def quantize(values, low, high, colors=len(PALETTE.colors)):
+    # the index in a palette of colors of each value, -1 for NaN
+    if high > low:
+        scaled = (values - low) / (high - low) * colors
+    else:
+        scaled = numpy.full(len(values), colors / 2)
+    with numpy.errstate(invalid='ignore'):
+        classes = numpy.floor(scaled).clip(0, colors - 1)
+    return numpy.where(numpy.isnan(values), -1, classes).astype(numpy.intp)
+
+
+def runs(values, lengths, low, high, colors=len(PALETTE.colors), max_runs=MAX_RUNS):
+    # splits a segment into runs of legs of one color; values and lengths
+    # are those of its legs. Returns the first and last point of each run,
+    # neighbouring runs sharing a point, and the index of its color. With
+    # more than max_runs, the segment is cut into max_runs pieces of equal
+    # length and each colored by its mean value
+    classes = quantize(values, low, high, colors)
+    changes = numpy.flatnonzero(classes[1:] != classes[:-1]) + 1
+    if len(changes) >= max_runs:
+        total = lengths.sum()
+        if total > 0:
+            cuts = numpy.searchsorted(numpy.cumsum(lengths), total * numpy.arange(1, max_runs) / max_runs)
+        else:
+            cuts = len(values) * numpy.arange(1, max_runs) // max_runs
+        starts = numpy.unique(numpy.r_[0, cuts.clip(0, len(values) - 1)])
+        weights = lengths if total > 0 else numpy.ones(len(values))
+        weights = numpy.where(numpy.isnan(values), 0., weights)
+        sums = numpy.add.reduceat(numpy.where(weights > 0, values * weights, 0.), starts)
+        counts = numpy.add.reduceat(weights, starts)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            means = numpy.where(counts > 0, sums / counts, numpy.nan)
+        classes = numpy.repeat(quantize(means, low, high, colors), numpy.diff(numpy.r_[starts, len(values)]))
+        changes = numpy.flatnonzero(classes[1:] != classes[:-1]) + 1
+    first = numpy.r_[0, changes]
+    last = numpy.r_[changes, len(values)]
+    return first, last, classes[first]
+
+
+class TrackColoring:
+    # The leg values and lengths of every segment of a track for one
+    # mode, computed once, so that a new palette only quantizes them again.
+
+    def __init__(self, track, mode):
+        self.mode = mode
+        self.values = [leg_values(s, mode) for s in track.segments]
+        self.lengths = [segment_distances(s) for s in track.segments]
+        self.low, self.high = value_range(self.values, mode)
+        # the point arrays these were computed from, see is_current
+        self._points = [s.lat for s in track.segments]
+
+    def is_current(self, track):
+        # false once the points have been swapped, added to or evicted
+        return len(track.segments) == len(self._points) and \
+            all(s.lat is lat for s, lat in zip(track.segments, self._points))
+
+    def runs(self, index, palette=PALETTE):
+        # see runs(), for segment index
+        if not len(self.values[index]):
+            return numpy.zeros(1, numpy.intp), numpy.zeros(1, numpy.intp), numpy.full(1, -1)
+        return runs(self.values[index], self.lengths[index], self.low, self.high, len(palette.colors))
@@ -0,0 +1,89 @@
+#
+#  dedup.py - Telling when a file or track is already loaded
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Needs neither GTK nor a display, so nothing here may import gi.
+#
+import hashlib
+
+from . import archive
+
+BLOCK_SIZE = 1 << 20
+
+
+def content_digest(filename):
+    # hash of the GPX document in filename, decompressed, so a copy from
+    # another folder or inside an archive hashes the same; None if it
+    # can't be read. Runs in a worker process
+    h = hashlib.blake2b(digest_size=16)
+    try:
+        with archive.open_gpx(filename) as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                h.update(block)
+    except (OSError,) + archive.ERRORS:
+        return None
+    return h.hexdigest()
+
+
+def track_fingerprint(track):
+    # the same activity exported twice starts at the same time with the
+    # same number of points; tracks without times have no fingerprint
+    start = track.summary.start_time
+    if start is None or start != start:
+        return None
+    return start, len(track)
+
+
+class LoadedTracks:
+    # The content digests of the loaded files and the fingerprints of the
+    # loaded tracks. claim_*() record a new one and return None, or return
+    # the file or track that already has it.
+
+    def __init__(self):
+        self._files = {}
+        self._digests = {}
+        self._tracks = {}
+
+    def claim_file(self, filename, digest):
+        existing = self._files.get(digest)
+        if existing is not None:
+            return existing
+        # the file has changed since it was loaded, the new content counts
+        self.release_file(filename)
+        self._files[digest] = filename
+        self._digests[filename] = digest
+        return None
+
+    def release_file(self, filename):
+        digest = self._digests.pop(filename, None)
+        if digest is not None:
+            del self._files[digest]
+
+    def claim_track(self, track):
+        fingerprint = track_fingerprint(track)
+        if fingerprint is None:
+            return None
+        existing = self._tracks.setdefault(fingerprint, track)
+        return existing if existing is not track else None
+
+    def release_track(self, track):
+        fingerprint = track_fingerprint(track)
+        if self._tracks.get(fingerprint) is track:
+            del self._tracks[fingerprint]
@@ -0,0 +1,196 @@
+#
+#  drawing.py - Drawing tracks on the map for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import numpy
+from gi.repository import OsmGpsMap
+
+from . import coloring
+from . import simplify
+from . import profiling
+
+
+class TrackDrawing:
+    # The OsmGpsMap.MapTrack objects drawing one track, a list of them
+    # per segment: one in the track's color, or with coloring set to
+    # coloring.SPEED or GRADIENT, one per run of a palette color. Each
+    # holds only the points of the simplification level for the current
+    # zoom, and is rebuilt when the zoom moves to another level. Hidden
+    # drawings drop their MapTracks and build them again when they are
+    # shown. With a memory.TrackMemory, evicted points are reloaded when
+    # the level needs them.
+
+    def __init__(self, map_, track, color, alpha=0.8, memory=None, coloring=None, palette=None):
+        self.map = map_
+        self.track = track
+        self.memory = memory
+        self.color = color
+        self.alpha = alpha
+        self.coloring = coloring
+        self.palette = palette
+        # coloring.TrackColoring for each mode used, see track_coloring
+        self._colorings = {}
+        self.visible = False
+        self.map_tracks = []
+        self.level = None
+        # Gtk.TreeRowReference of the row showing the track, set by the UI
+        self.row = None
+
+    def _make_map_track(self, lat, lon, color):
+        map_track = OsmGpsMap.MapTrack()
+        map_track.set_color(color)
+        map_track.props.alpha = self.alpha
+
+        with profiling.span('MapTrack.add_point', points=len(lat)):
+            for la, lo in zip(lat.tolist(), lon.tolist()):
+                map_track.add_point(OsmGpsMap.MapPoint.new_degrees(la, lo))
+        return map_track
+
+    def _make_map_tracks(self, index):
+        segment = self.track.segments[index]
+        if self.coloring is None:
+            lat, lon = self.segment_points(segment)
+            return [self._make_map_track(lat, lon, self.color)]
+
+        palette = self.palette or coloring.PALETTE
+        indices = simplify.level_indices(segment.rank, self.level)
+        map_tracks = []
+        for first, last, shade in zip(*self.track_coloring().runs(index, palette)):
+            # the points of the level within the run, and both its ends so
+            # that the runs join up
+            if indices is None:
+                run = numpy.arange(first, last + 1)
+            else:
+                run = indices[numpy.searchsorted(indices, first):numpy.searchsorted(indices, last, 'right')]
+                run = numpy.unique(numpy.r_[first, run, last])
+            color = palette.colors[shade] if shade >= 0 else palette.missing
+            map_tracks.append(self._make_map_track(segment.lat[run], segment.lon[run], color))
+        return map_tracks
+
+    def track_coloring(self):
+        # the leg values are worked out once per mode, and again only when
+        # the points change
+        values = self._colorings.get(self.coloring)
+        if values is None or not values.is_current(self.track):
+            values = self._colorings[self.coloring] = coloring.TrackColoring(self.track, self.coloring)
+        return values
+
+    def segment_points(self, segment):
+        # the latitudes and longitudes drawn at the current level
+        indices = simplify.level_indices(segment.rank, self.level)
+        if indices is None:
+            return segment.lat, segment.lon
+        return segment.lat[indices], segment.lon[indices]
+
+    def _all_map_tracks(self):
+        return [m for map_tracks in self.map_tracks for m in map_tracks]
+
+    def _build(self):
+        self.level = simplify.level(self.map.props.zoom)
+        if self.memory:
+            self.memory.need(self.track, self.level)
+        self.map_tracks = [self._make_map_tracks(i) for i in range(len(self.track.segments))]
+        for map_track in self._all_map_tracks():
+            self.map.track_add(map_track)
+
+    def _clear(self, removed=False):
+        if not removed:
+            for map_track in self._all_map_tracks():
+                self.map.track_remove(map_track)
+        self.map_tracks = []
+
+    def set_visible(self, visible, removed=False):
+        # removed: the map tracks were taken off the map already, along
+        # with every other one by Map.track_remove_all
+        if visible == self.visible:
+            return
+        self.visible = visible
+        if visible:
+            self._build()
+        else:
+            self._clear(removed)
+
+    def refresh(self):
+        # draws the track again if shown, such as once the points of an
+        # evicted track are back
+        if self.visible:
+            self._clear()
+            self._build()
+
+    def remove(self):
+        self.set_visible(False)
+
+    def set_zoom(self, zoom):
+        lvl = simplify.level(zoom)
+        if not self.visible or lvl == self.level:
+            return
+        self.level = lvl
+        if self.memory:
+            self.memory.need(self.track, lvl)
+        for i in range(len(self.track.segments)):
+            old = self.map_tracks[i]
+            self.map_tracks[i] = self._make_map_tracks(i)
+            for map_track in self.map_tracks[i]:
+                self.map.track_add(map_track)
+            for map_track in old:
+                self.map.track_remove(map_track)
+
+    def extend(self, index, start):
+        # draws the points from start on, just added to segment index of
+        # the track, or the whole of a new segment. They are added as they
+        # are, the segment is simplified again with the next change of level
+        if not self.visible:
+            return
+        if self.coloring is not None:
+            # the new values can move the whole track's palette range
+            self.refresh()
+            return
+        segment = self.track.segments[index]
+        if index == len(self.map_tracks):
+            self.map_tracks.append(self._make_map_tracks(index))
+            for map_track in self.map_tracks[index]:
+                self.map.track_add(map_track)
+            return
+        map_track = self.map_tracks[index][0]
+        for la, lo in zip(segment.lat[start:].tolist(), segment.lon[start:].tolist()):
+            map_track.add_point(OsmGpsMap.MapPoint.new_degrees(la, lo))
+
+    def set_color(self, color):
+        # the track's own color, shown when it isn't colored by a value
+        self.color = color
+        if self.coloring is None:
+            for map_track in self._all_map_tracks():
+                map_track.set_color(color)
+
+    def set_coloring(self, mode, palette=None):
+        # mode is None for the track's own color, or coloring.SPEED or
+        # GRADIENT, shown with a coloring.Palette, by default coloring.PALETTE
+        if (mode, palette) == (self.coloring, self.palette):
+            return
+        self.coloring = mode
+        self.palette = palette
+        self.refresh()
+
+    def set_alpha(self, alpha):
+        if alpha == self.alpha:
+            return
+        self.alpha = alpha
+        for map_track in self._all_map_tracks():
+            map_track.props.alpha = alpha
@@ -0,0 +1,208 @@
+#
+#  follow.py - Reading the points appended to a GPX file still being recorded
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Needs neither GTK nor a display, so nothing here may import gi.
+#
+import os
+import re
+from xml.etree.ElementTree import XMLPullParser, ParseError
+from xml.sax.saxutils import quoteattr
+
+from .reader import GPXReadError, read_point
+from . import archive
+
+# the end of a complete trkpt; nothing after the last one is parsed, so
+# the closing tags a logger writes and rewrites after every point are
+# never seen
+POINT_END = re.compile(rb'</(?:[\w.-]+:)?trkpt\s*>|<(?:[\w.-]+:)?trkpt\b[^>]*/>')
+# bytes before the new data compared with what was parsed, to notice a
+# file that was replaced rather than appended to
+TAIL_BYTES = 64
+# kept for a follower rebuilt from a pickle, as it names the encoding
+XML_DECLARATION = re.compile(rb'\s*<\?xml\b.*?\?>', re.DOTALL)
+
+
+def can_follow(filename):
+    # only plain files can be read from where the last poll stopped
+    return os.path.isfile(filename) and not archive.is_archive(filename) and \
+        os.path.splitext(filename)[1].lower() not in archive.COMPRESSORS
+
+
+def start_following(filename, loaded):
+    # runs in a worker process, as the first poll reads the whole file.
+    # loaded is {track index: [points of each segment]} of the tracks
+    # already shown. Returns the follower, ready to go on polling, and the
+    # chunks of the first poll without those points or any of the tracks
+    # not shown
+    follower = GPXFollower(filename)
+    chunks = []
+    for chunk in follower.poll():
+        track, segment, first = chunk[:3]
+        if track not in loaded:
+            continue
+        counts = loaded[track]
+        skip = max((counts[segment] if segment < len(counts) else 0) - first, 0)
+        if skip < len(chunk[3]):
+            chunks.append((track, segment, first + skip) + tuple(values[skip:] for values in chunk[3:]))
+    return follower, chunks
+
+
+class GPXFollower:
+    # Parses a GPX file a piece at a time as it grows. Each poll() reads
+    # what was appended since the one before and returns the new points as
+    # (track, segment, first, lat, lon, ele, time): the indices of the
+    # track in the file and of the segment among the track's non empty
+    # ones, as reader.read_gpx counts them, the index in the segment of the
+    # first new point, and lists of their values. The first poll returns
+    # every point in the file. A follower can be pickled, to be handed back
+    # from start_following.
+
+    def __init__(self, filename):
+        self.filename = filename
+        # track index -> name, for tracks found while following
+        self.names = {}
+        # bytes of the file parsed so far
+        self.offset = 0
+        self._parser = XMLPullParser(events=('start-ns', 'start', 'end'))
+        self._declaration = b''
+        # (tag, [(prefix, uri) declared on it]) of the elements still open
+        self._open = []
+        self._ns = []
+        self._tail = b''
+        self._track = -1
+        self._trk = None
+        self._segment = -1
+        self._seg_elem = None
+        self._seg_started = False
+        self._seg_points = 0
+
+    def poll(self):
+        # raises GPXReadError if the file is no longer the one being
+        # followed, or EnvironmentError if it can't be read
+        with open(self.filename, 'rb') as f:
+            start = self.offset - len(self._tail)
+            f.seek(start)
+            if f.read(len(self._tail)) != self._tail:
+                raise GPXReadError('%s was rewritten' % self.filename)
+            data = f.read()
+
+        end = 0
+        for match in POINT_END.finditer(data):
+            end = match.end()
+        if not end:
+            return []
+        if not self.offset:
+            match = XML_DECLARATION.match(data)
+            self._declaration = match.group(0) if match else b''
+        self._tail = (self._tail + data[:end])[-TAIL_BYTES:]
+        self.offset += end
+        try:
+            self._parser.feed(data[:end])
+            return self._read_events()
+        except (ParseError, ValueError, TypeError) as e:
+            raise GPXReadError(str(e)) from e
+
+    @property
+    def tracks(self):
+        # how many tracks have been met so far
+        return self._track + 1
+
+    def __getstate__(self):
+        # the parser and the elements it made are rebuilt from _open
+        state = self.__dict__.copy()
+        del state['_parser']
+        state['_trk'] = self._trk is not None
+        state['_seg_elem'] = self._seg_elem is not None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._parser = XMLPullParser(events=('start-ns', 'start', 'end'))
+        # the start tags of the open elements, with the namespaces in
+        # scope, so that the parser goes on from where the last poll
+        # stopped. Each tag is made unprefixed in its own namespace
+        tags = []
+        for tag, declared in self._open:
+            uri, _, local = tag[1:].rpartition('}') if tag.startswith('{') else ('', '', tag)
+            namespaces = dict(declared)
+            namespaces[''] = uri
+            tags.append('<%s%s>' % (local, ''.join(
+                ' xmlns%s=%s' % (':' + prefix if prefix else '', quoteattr(value))
+                for prefix, value in namespaces.items())))
+        self._parser.feed(self._declaration + ''.join(tags).encode('utf-8'))
+        trk = seg = None
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                tag = elem.tag.rpartition('}')[2]
+                if tag == 'trk':
+                    trk = elem
+                elif tag == 'trkseg':
+                    seg = elem
+        self._trk = trk if self._trk else None
+        self._seg_elem = seg if self._seg_elem else None
+
+    def _read_events(self):
+        chunks = []
+        chunk = None
+        for event, elem in self._parser.read_events():
+            if event == 'start-ns':
+                self._ns.append(elem)
+                continue
+            if event == 'start':
+                self._open.append((elem.tag, self._ns))
+                self._ns = []
+            else:
+                self._open.pop()
+            tag = elem.tag.rpartition('}')[2]
+            if event == 'start':
+                if tag == 'trk':
+                    self._track += 1
+                    self._trk = elem
+                    self._segment = -1
+                elif tag == 'trkseg' and self._trk is not None:
+                    self._seg_elem = elem
+                    self._seg_started = False
+                continue
+
+            if tag == 'trkpt' and self._seg_elem is not None:
+                # empty segments aren't counted, like in reader.read_gpx
+                if not self._seg_started:
+                    self._seg_started = True
+                    self._segment += 1
+                    self._seg_points = 0
+                if chunk is None or chunk[:2] != (self._track, self._segment):
+                    chunk = (self._track, self._segment, self._seg_points, [], [], [], [])
+                    chunks.append(chunk)
+                for values, value in zip(chunk[3:], read_point(elem)):
+                    values.append(value)
+                self._seg_points += 1
+                del self._seg_elem[:]
+            elif tag == 'trkseg' and self._seg_elem is not None:
+                self._seg_elem = None
+                elem.clear()
+            elif tag == 'name' and self._trk is not None and self._seg_elem is None:
+                self.names.setdefault(self._track, elem.text)
+            elif tag == 'trk' and self._trk is not None:
+                self._trk = None
+                elem.clear()
+            elif tag in ('wpt', 'rte'):
+                elem.clear()
+        return chunks
@@ -0,0 +1,136 @@
+#
+#  heatmap.py - Density of the loaded tracks, for drawing many at once
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Needs neither GTK nor a display, so nothing here may import gi.
+#
+import numpy
+
+from . import simplify
+from .memory import COARSE_LEVEL
+
+TILE = simplify.TILE_SIZE
+
+# Grids go up to the zoom whose points evicted tracks still have, so a
+# track adds and later subtracts exactly the same pixels. Closer in, the
+# grid of MAX_ZOOM is drawn magnified.
+MAX_ZOOM = COARSE_LEVEL
+
+
+def pixel_counts(track, zoom):
+    # [((tile x, tile y), TILE x TILE array of 0 and 1), ...] marking the
+    # pixels the track passes through at zoom
+    scale = 2 ** zoom
+    n = TILE * scale
+    lvl = simplify.level(zoom)
+    keys = []
+    for segment in track.segments:
+        if not len(segment):
+            continue
+        indices = simplify.level_indices(segment.rank, lvl)
+        lat, lon = (segment.lat, segment.lon) if indices is None else (segment.lat[indices], segment.lon[indices])
+        x, y = simplify.project(lat, lon)
+        x, y = simplify.densify(x * scale, y * scale, 1.0)
+        ix = numpy.clip(x.astype(numpy.int64), 0, n - 1)
+        iy = numpy.clip(y.astype(numpy.int64), 0, n - 1)
+        keys.append(iy * n + ix)
+    if not keys:
+        return []
+
+    # each track counts once per pixel, however often it passes
+    iy, ix = numpy.divmod(numpy.unique(numpy.concatenate(keys)), n)
+    tiles = (iy // TILE) * scale + ix // TILE
+    offsets = (iy % TILE) * TILE + ix % TILE
+    order = numpy.argsort(tiles, kind='stable')
+    tiles, offsets = tiles[order], offsets[order]
+    starts = numpy.flatnonzero(numpy.r_[True, tiles[1:] != tiles[:-1]])
+    ends = numpy.r_[starts[1:], len(tiles)]
+
+    counts = []
+    for start, end in zip(starts, ends):
+        ty, tx = divmod(int(tiles[start]), scale)
+        grid = numpy.bincount(offsets[start:end], minlength=TILE * TILE).reshape(TILE, TILE)
+        counts.append(((tx, ty), grid.astype(numpy.uint16)))
+    return counts
+
+
+class HeatmapGrids:
+    # For every zoom up to MAX_ZOOM, a TILE x TILE grid per map tile of how
+    # many tracks cross each pixel. Only tiles some track crosses exist,
+    # at 128 kB each.
+
+    def __init__(self, max_zoom=MAX_ZOOM):
+        self.max_zoom = max_zoom
+        self.levels = [{} for _ in range(max_zoom + 1)]
+        self._tracks = set()
+        self._max = {}
+        # bumped on every change, so drawings can tell when to recolour
+        self.version = 0
+
+    def __contains__(self, track):
+        return track in self._tracks
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def add(self, track):
+        if track in self._tracks:
+            return
+        self._tracks.add(track)
+        self._update(track, 1)
+
+    def remove(self, track):
+        if track not in self._tracks:
+            return
+        self._tracks.discard(track)
+        self._update(track, -1)
+
+    def _update(self, track, sign):
+        for zoom, tiles in enumerate(self.levels):
+            for key, counts in pixel_counts(track, zoom):
+                grid = tiles.get(key)
+                if grid is None:
+                    grid = tiles[key] = numpy.zeros((TILE, TILE), dtype=numpy.uint16)
+                if sign > 0:
+                    grid += counts
+                else:
+                    grid -= counts
+                    if not grid.any():
+                        del tiles[key]
+        self._max.clear()
+        self.version += 1
+
+    def max_count(self, zoom):
+        if zoom not in self._max:
+            self._max[zoom] = max((int(g.max()) for g in self.levels[zoom].values()), default=0)
+        return self._max[zoom]
+
+
+def colorize(grid, max_count):
+    # premultiplied ARGB32 pixels of grid, transparent where no track
+    # passes, then dark red through yellow to white on a log scale
+    v = numpy.log1p(grid) / numpy.log1p(max(max_count, 1))
+    a = numpy.where(grid > 0, 96 + 159 * v, 0)
+    r = a
+    g = numpy.clip(v * 2 - 0.5, 0, 1) * a
+    b = numpy.clip(v * 3 - 2, 0, 1) * a
+    pixels = (a.astype(numpy.uint32) << 24) | (r.astype(numpy.uint32) << 16) | \
+        (g.astype(numpy.uint32) << 8) | b.astype(numpy.uint32)
+    return numpy.ascontiguousarray(pixels)
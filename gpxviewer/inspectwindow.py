@@ -0,0 +1,67 @@
+#
+#  inspectwindow.py - Elevation and speed profiles of one track
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+from gi.repository import Gtk
+
+from .series import TrackSeries
+from .stats import ProfileChart
+
+import gettext
+_ = gettext.gettext
+
+
+class InspectWindow(Gtk.Window):
+    # Elevation over distance and speed over time of every point of a
+    # track. on_hover(lat, lon) is called with the point under the pointer
+    # in either profile, and on_hover(None, None) when there is none.
+
+    def __init__(self, track, on_hover, parent=None):
+        Gtk.Window.__init__(self, title=_("Inspect %s") % (track.name or _("Track")))
+        self.set_transient_for(parent)
+        self.resize(800, 600)
+        self.on_hover = on_hover
+        self.connect("destroy", lambda *a: on_hover(None, None))
+
+        # copies of the points, so the track can be evicted meanwhile
+        self.series = TrackSeries(track)
+        self.elevation = ProfileChart(self.series.distance / 1000, self.series.ele,
+                                      _("Elevation"), _("distance [km]"), _("elevation [m]"))
+        self.speed = ProfileChart(self.series.elapsed() / 60, self.series.speed * 3.6,
+                                  _("Speed"), _("time [min]"), _("speed [km/h]"))
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        box.set_border_width(4)
+        self.add(box)
+        for chart in (self.elevation, self.speed):
+            chart.onHover = self.hover
+            label = Gtk.Label(xalign=0)
+            label.set_markup("<b>%s</b>" % chart.title)
+            box.pack_start(label, False, False, 0)
+            box.pack_start(chart.chart(), True, True, 0)
+        hint = Gtk.Label(_("Drag across a profile to zoom in, right click to zoom out"), xalign=0)
+        hint.get_style_context().add_class("dim-label")
+        box.pack_start(hint, False, False, 0)
+
+    def hover(self, index):
+        if index is None:
+            self.on_hover(None, None)
+        else:
+            self.on_hover(float(self.series.lat[index]), float(self.series.lon[index]))
@@ -0,0 +1,128 @@
+#
+#  layers.py - Map layers drawn with cairo for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Layers subclass OsmGpsMap.MapLayer, so unlike drawing.py this needs the
+#  real GTK libraries to be imported.
+#
+import math
+
+import cairo
+from gi.repository import GObject
+from gi.repository import OsmGpsMap
+
+from . import simplify
+from .heatmap import colorize, TILE
+
+
+class HeatmapLayer(GObject.GObject, OsmGpsMap.MapLayer):
+    # Draws heatmap.HeatmapGrids over the map, one image per map tile in
+    # view. Past the last zoom with grids, that zoom's images are magnified.
+
+    def __init__(self, grids):
+        GObject.GObject.__init__(self)
+        self.grids = grids
+        # (zoom, tile x, tile y) -> cairo.ImageSurface, for grids.version
+        self._surfaces = {}
+        self._version = None
+
+    def _surface(self, zoom, tx, ty, grid):
+        key = (zoom, tx, ty)
+        surface = self._surfaces.get(key)
+        if surface is None:
+            pixels = colorize(grid, self.grids.max_count(zoom))
+            surface = self._surfaces[key] = cairo.ImageSurface.create_for_data(
+                pixels, cairo.FORMAT_ARGB32, TILE, TILE, TILE * 4)
+        return surface
+
+    def do_render(self, map_):
+        pass
+
+    def do_draw(self, map_, cr):
+        if self._version != self.grids.version:
+            self._surfaces.clear()
+            self._version = self.grids.version
+
+        zoom = min(map_.props.zoom, self.grids.max_zoom)
+        tiles = self.grids.levels[zoom]
+        if not tiles:
+            return
+        pt1, pt2 = map_.get_bbox()
+        lat1, lon1 = pt1.get_degrees()
+        lat2, lon2 = pt2.get_degrees()
+        scale = 2 ** zoom
+        x0, y0 = simplify.project(max(lat1, lat2), min(lon1, lon2))
+        x1, y1 = simplify.project(min(lat1, lat2), max(lon1, lon2))
+        x0, y0, x1, y1 = float(x0) * scale, float(y0) * scale, float(x1) * scale, float(y1) * scale
+
+        cr.save()
+        cr.scale(2 ** (map_.props.zoom - zoom), 2 ** (map_.props.zoom - zoom))
+        for tx in range(int(x0 // TILE), int(x1 // TILE) + 1):
+            for ty in range(int(y0 // TILE), int(y1 // TILE) + 1):
+                grid = tiles.get((tx, ty))
+                if grid is not None:
+                    cr.set_source_surface(self._surface(zoom, tx, ty, grid), tx * TILE - x0, ty * TILE - y0)
+                    cr.paint()
+        cr.restore()
+
+    def do_busy(self):
+        return False
+
+    def do_button_press(self, map_, event):
+        return False
+
+
+class MarkerLayer(GObject.GObject, OsmGpsMap.MapLayer):
+    # A dot on the map at one position, such as the point under the
+    # pointer in a profile of the track.
+
+    RADIUS = 6
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self.position = None
+
+    def set_position(self, lat=None, lon=None):
+        # returns whether the dot moved, so the caller knows to redraw
+        position = None if lat is None else (lat, lon)
+        if position == self.position:
+            return False
+        self.position = position
+        return True
+
+    def do_render(self, map_):
+        pass
+
+    def do_draw(self, map_, cr):
+        if self.position is None:
+            return
+        x, y = map_.convert_geographic_to_screen(OsmGpsMap.MapPoint.new_degrees(*self.position))
+        cr.arc(x, y, self.RADIUS, 0, 2 * math.pi)
+        cr.set_source_rgb(1, 1, 1)
+        cr.fill_preserve()
+        cr.set_source_rgb(0.8, 0, 0)
+        cr.set_line_width(3)
+        cr.stroke()
+
+    def do_busy(self):
+        return False
+
+    def do_button_press(self, map_, event):
+        return False
@@ -0,0 +1,198 @@
+#
+#  library.py - Index of GPX files in the user's folders for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import os
+import sqlite3
+import hashlib
+from collections import namedtuple
+
+from .reader import read_gpx, GPXReadError
+from .aggregates import get_average_speed
+from . import archive
+
+# compressed files too, archives are opened rather than indexed
+GPX_EXTENSIONS = archive.GPX_SUFFIXES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT NOT NULL,
+    track INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    name TEXT,
+    points INTEGER,
+    start_time REAL,
+    end_time REAL,
+    min_lat REAL,
+    min_lon REAL,
+    max_lat REAL,
+    max_lon REAL,
+    distance REAL,
+    moving_time REAL,
+    max_speed REAL,
+    average_speed REAL,
+    PRIMARY KEY (path, track)
+);
+CREATE INDEX IF NOT EXISTS tracks_start_time ON tracks (start_time);
+"""
+
+COLUMNS = ('path', 'track', 'mtime', 'size', 'hash', 'name', 'points', 'start_time', 'end_time',
+           'min_lat', 'min_lon', 'max_lat', 'max_lon', 'distance', 'moving_time', 'max_speed',
+           'average_speed')
+
+LibraryTrack = namedtuple('LibraryTrack', COLUMNS)
+
+# a file that can't be read is still recorded, as a row with track -1, so
+# that it isn't read again until it changes
+UNREADABLE = -1
+
+
+def file_hash(filename):
+    h = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def index_file(filename):
+    # runs in a worker process, returns the rows describing filename
+    try:
+        st = os.stat(filename)
+        digest = file_hash(filename)
+    except EnvironmentError:
+        return []
+    try:
+        tracks = read_gpx(filename)
+    except (GPXReadError, EnvironmentError):
+        tracks = None
+
+    if not tracks:
+        return [LibraryTrack(filename, UNREADABLE, st.st_mtime_ns, st.st_size, digest,
+                             None, 0, None, None, None, None, None, None, 0., 0., 0., 0.)]
+
+    rows = []
+    for i, track in enumerate(tracks):
+        s = track.summary
+        bounds = s.bounds or (None, None, None, None)
+        rows.append(LibraryTrack(
+            filename, i, st.st_mtime_ns, st.st_size, digest, track.name, len(track),
+            s.start_time, s.end_time, bounds[0], bounds[1], bounds[2], bounds[3],
+            s.moving_distance, s.moving_time, s.max_speed, get_average_speed(s)))
+    return rows
+
+
+def scan(paths, stamps):
+    # runs on a thread, as walking and stat'ing a big folder is slow on
+    # network mounts. paths are folders to walk or files, stamps is
+    # TrackLibrary.stamps(). Returns the folders walked, the GPX files
+    # that aren't indexed as they are now, and the indexed files within
+    # paths that no longer exist
+    folders = []
+    stale = []
+    found = set()
+
+    def check(filename):
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return
+        found.add(filename)
+        if stamps.get(filename) != (st.st_mtime_ns, st.st_size):
+            stale.append(filename)
+
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                folders.append(dirpath)
+                for filename in filenames:
+                    if filename.lower().endswith(GPX_EXTENSIONS):
+                        check(os.path.join(dirpath, filename))
+        elif path.lower().endswith(GPX_EXTENSIONS):
+            check(path)
+
+    prefixes = tuple(os.path.join(path, '') for path in paths)
+    missing = [filename for filename in stamps
+               if filename not in found and (filename in paths or filename.startswith(prefixes))
+               and not os.path.exists(filename)]
+    return folders, stale, missing
+
+
+class TrackLibrary:
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def folders(self):
+        return [r[0] for r in self.db.execute('SELECT path FROM folders ORDER BY path')]
+
+    def add_folder(self, folder):
+        with self.db:
+            self.db.execute('INSERT OR IGNORE INTO folders VALUES (?)', (os.path.abspath(folder),))
+
+    def remove_folder(self, folder):
+        folder = os.path.abspath(folder)
+        with self.db:
+            self.db.execute('DELETE FROM folders WHERE path = ?', (folder,))
+            self.db.execute("DELETE FROM tracks WHERE path LIKE ? ESCAPE '\\'",
+                            (_like_prefix(folder + os.sep),))
+
+    def tracks(self):
+        # every readable track, newest first
+        cursor = self.db.execute(
+            'SELECT %s FROM tracks WHERE track >= 0 ORDER BY start_time DESC' % ', '.join(COLUMNS))
+        return [LibraryTrack(*r) for r in cursor]
+
+    def bounds(self, filenames):
+        # {filename: (min lat, min lon, max lat, max lon)} of the indexed
+        # files among filenames
+        wanted = set(filenames)
+        cursor = self.db.execute('SELECT path, MIN(min_lat), MIN(min_lon), MAX(max_lat), MAX(max_lon) '
+                                 'FROM tracks WHERE track >= 0 AND min_lat IS NOT NULL GROUP BY path')
+        return {r[0]: r[1:] for r in cursor if r[0] in wanted}
+
+    def stamps(self):
+        # {path: (mtime, size)} of every indexed file, as it was indexed
+        return {path: (mtime, size) for path, mtime, size in
+                self.db.execute('SELECT DISTINCT path, mtime, size FROM tracks')}
+
+    def update(self, filename, rows):
+        with self.db:
+            self.db.execute('DELETE FROM tracks WHERE path = ?', (filename,))
+            self.db.executemany('INSERT INTO tracks VALUES (%s)' % ', '.join('?' * len(COLUMNS)), rows)
+
+    def remove(self, filename):
+        with self.db:
+            self.db.execute('DELETE FROM tracks WHERE path = ?', (filename,))
+
+
+def _like_prefix(prefix):
+    for c in '\\%_':
+        prefix = prefix.replace(c, '\\' + c)
+    return prefix + '%'
@@ -0,0 +1,267 @@
+#
+#  librarywindow.py - Browsing the track library of GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import os
+import threading
+from datetime import datetime
+
+from gi.repository import GLib
+from gi.repository import Gio
+from gi.repository import Gtk
+
+from .library import scan, index_file, UNREADABLE
+from .loader import GPXLoader
+
+import gettext
+_ = gettext.gettext
+
+# file changes are collected for this long before they are re-indexed
+RESCAN_DELAY_MS = 1000
+
+MONITOR_EVENTS = (
+    Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+    Gio.FileMonitorEvent.CREATED,
+    Gio.FileMonitorEvent.DELETED,
+    Gio.FileMonitorEvent.MOVED_IN,
+    Gio.FileMonitorEvent.MOVED_OUT,
+    Gio.FileMonitorEvent.RENAMED,
+)
+
+
+class LibraryWindow(Gtk.Window):
+    PATH_IDX = 0
+    NAME_IDX = 1
+    START_IDX = 2
+    DISTANCE_IDX = 3
+    DURATION_IDX = 4
+    SPEED_IDX = 5
+
+    def __init__(self, library, show_files, parent=None):
+        Gtk.Window.__init__(self, title=_("Track Library"))
+        self.set_transient_for(parent)
+        self.resize(700, 500)
+        self.connect("delete-event", lambda *a: self.hide() or True)
+
+        self.library = library
+        self.show_files = show_files
+        self.indexer = GPXLoader(self.on_indexed, self.on_indexing_progress, work=index_file)
+        self.monitors = {}
+        self.pendingPaths = set()
+        self.rescanId = None
+        # path -> [Gtk.TreeIter], list store iters persist
+        self.rows = {}
+
+        # path, name, start_time, distance, moving_time, average_speed
+        self.store = Gtk.ListStore(str, str, float, float, float, float)
+        self.filter = self.store.filter_new()
+        self.filter.set_visible_func(self.row_visible)
+        self.sorted = Gtk.TreeModelSort(model=self.filter)
+        self.sorted.set_sort_column_id(self.START_IDX, Gtk.SortType.DESCENDING)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        box.set_border_width(4)
+        self.add(box)
+
+        toolbar = Gtk.Box(spacing=4)
+        box.pack_start(toolbar, False, False, 0)
+        button = Gtk.Button.new_with_mnemonic(_("_Add Folder..."))
+        button.connect("clicked", self.add_folder_clicked)
+        toolbar.pack_start(button, False, False, 0)
+        button = Gtk.Button.new_with_mnemonic(_("_Show on Map"))
+        button.connect("clicked", self.show_selected_clicked)
+        toolbar.pack_start(button, False, False, 0)
+        self.search = Gtk.SearchEntry()
+        self.search.connect("search-changed", lambda *a: self.filter.refilter())
+        toolbar.pack_end(self.search, False, False, 0)
+
+        self.tv = Gtk.TreeView(model=self.sorted)
+        self.tv.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
+        self.tv.connect("row-activated", self.row_activated)
+        self.tv.set_fixed_height_mode(True)
+        for title, idx, fmt in (
+                (_("Name"), self.NAME_IDX, None),
+                (_("Date"), self.START_IDX, self.format_date),
+                (_("Distance [km]"), self.DISTANCE_IDX, lambda v: '%.2f' % (v / 1000)),
+                (_("Duration"), self.DURATION_IDX, self.format_duration),
+                (_("Average Speed [m/s]"), self.SPEED_IDX, lambda v: '%.2f' % v)):
+            renderer = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, renderer)
+            column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+            column.set_fixed_width(250 if idx == self.NAME_IDX else 110)
+            column.set_resizable(True)
+            column.set_sort_column_id(idx)
+            if fmt:
+                column.set_cell_data_func(renderer, self._format_cell, (idx, fmt))
+            else:
+                column.add_attribute(renderer, "text", idx)
+            self.tv.append_column(column)
+        sw = Gtk.ScrolledWindow()
+        sw.add(self.tv)
+        box.pack_start(sw, True, True, 0)
+
+        self.status = Gtk.Label(xalign=0)
+        box.pack_start(self.status, False, False, 0)
+
+        self.populate()
+        self.scan_paths(self.library.folders())
+
+    @staticmethod
+    def format_date(t):
+        return datetime.fromtimestamp(t).strftime("%x %X") if t else '--'
+
+    @staticmethod
+    def format_duration(t):
+        hours, remain = divmod(int(t), 3600)
+        minutes, seconds = divmod(remain, 60)
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+    def _format_cell(self, column, cell, model, _iter, data):
+        idx, fmt = data
+        cell.props.text = fmt(model.get_value(_iter, idx))
+
+    def row_visible(self, model, _iter, data):
+        text = self.search.get_text().lower()
+        if not text:
+            return True
+        name = model.get_value(_iter, self.NAME_IDX) or ''
+        path = model.get_value(_iter, self.PATH_IDX) or ''
+        return text in name.lower() or text in path.lower()
+
+    def _append(self, t):
+        _iter = self.store.append([
+            t.path, t.name or os.path.basename(t.path), t.start_time or 0.,
+            t.distance or 0., t.moving_time or 0., t.average_speed or 0.])
+        self.rows.setdefault(t.path, []).append(_iter)
+
+    def populate(self):
+        # detach the model while filling it, so 20,000 rows don't send
+        # 20,000 rounds of signals to the view
+        self.tv.set_model(None)
+        self.store.clear()
+        self.rows = {}
+        for t in self.library.tracks():
+            self._append(t)
+        self.tv.set_model(self.sorted)
+        self.update_status()
+
+    def update_status(self, text=None):
+        if text is None:
+            text = _("%d tracks") % len(self.store)
+        self.status.set_text(text)
+
+    def _remove_rows(self, path):
+        for _iter in self.rows.pop(path, ()):
+            self.store.remove(_iter)
+
+    def on_indexed(self, batch):
+        for filename, rows in batch:
+            self._remove_rows(filename)
+            # None if the worker failed, such as on a corrupt file; it is
+            # indexed again once it changes or on the next start
+            if rows:
+                self.library.update(filename, rows)
+            else:
+                self.library.remove(filename)
+            for t in rows or ():
+                if t.track != UNREADABLE:
+                    self._append(t)
+
+    def on_indexing_progress(self, done, total):
+        if total:
+            self.update_status(_("Indexing %(done)d of %(total)d files...") % {"done": done, "total": total})
+        else:
+            self.update_status()
+
+    def add_folder_clicked(self, *args):
+        chooser = Gtk.FileChooserDialog(title=_("Choose a folder to add to the library"),
+                                        action=Gtk.FileChooserAction.SELECT_FOLDER, parent=self)
+        chooser.add_button(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL)
+        chooser.add_button(Gtk.STOCK_ADD, Gtk.ResponseType.OK)
+        if chooser.run() == Gtk.ResponseType.OK:
+            folder = chooser.get_filename()
+            self.library.add_folder(folder)
+            self.scan_paths([folder])
+        chooser.destroy()
+
+    def selected_paths(self):
+        model, paths = self.tv.get_selection().get_selected_rows()
+        seen = []
+        for path in paths:
+            filename = model[path][self.PATH_IDX]
+            if filename not in seen:
+                seen.append(filename)
+        return seen
+
+    def show_selected_clicked(self, *args):
+        self.show_files(self.selected_paths())
+
+    def row_activated(self, tv, path, column):
+        self.show_files([self.sorted[path][self.PATH_IDX]])
+
+    def scan_paths(self, paths):
+        # folders and files are walked and stat'ed on a thread, see
+        # library.scan; only the results are dealt with here
+        if not paths:
+            return
+        stamps = self.library.stamps()
+
+        def run():
+            GLib.idle_add(self._scan_done, *scan(paths, stamps))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _scan_done(self, folders, stale, missing):
+        # Gio monitors don't recurse, so every directory gets its own. They
+        # are made here, to report changes to this thread's main loop
+        for folder in folders:
+            if folder in self.monitors:
+                continue
+            monitor = Gio.File.new_for_path(folder).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            monitor.connect("changed", self.on_folder_changed)
+            self.monitors[folder] = monitor
+        for path in missing:
+            self.library.remove(path)
+            self._remove_rows(path)
+        self.indexer.load(stale)
+        return False
+
+    def on_folder_changed(self, monitor, f, other, event):
+        if event not in MONITOR_EVENTS:
+            return
+        # whether each is a folder, a GPX file or gone is left to scan_paths
+        for changed in (f, other):
+            path = changed.get_path() if changed else None
+            if path:
+                self.pendingPaths.add(path)
+        if self.pendingPaths and self.rescanId is None:
+            self.rescanId = GLib.timeout_add(RESCAN_DELAY_MS, self.reindex_pending)
+
+    def reindex_pending(self):
+        self.rescanId = None
+        paths, self.pendingPaths = self.pendingPaths, set()
+        self.scan_paths(list(paths))
+        return False
+
+    def shutdown(self):
+        self.indexer.shutdown()
+        for monitor in self.monitors.values():
+            monitor.cancel()
+        self.library.close()
@@ -0,0 +1,349 @@
+#
+#  loader.py - Background GPX loading for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import os
+import heapq
+import functools
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from queue import SimpleQueue, Empty
+
+from gi.repository import GLib
+
+from .cache import TrackCache
+from .reader import read_gpx, GPXReadError
+from .dedup import content_digest
+from . import profiling
+
+# how often finished files are handed back to the main loop
+DISPATCH_INTERVAL_MS = 100
+# files handed to the pool at a time, per worker; the rest wait in the
+# loader's own queue where they can still be reordered
+IN_FLIGHT_PER_WORKER = 2
+
+
+def parse_file(filename, cache_dir=None):
+    # runs in a worker process and returns the tracks with their summaries
+    # and simplifications computed. Errors are reported as None because not every gpxpy
+    # exception survives the trip back through pickle
+    cache = TrackCache(cache_dir) if cache_dir else None
+    try:
+        if cache:
+            # taken first, so that tracks of a file rewritten while being
+            # read aren't cached as those of the new one
+            stamp = cache.stamp(filename)
+            with profiling.span('cache.get', file=filename) as span:
+                tracks = cache.get(filename)
+                if tracks is not None:
+                    span.set(points=sum(len(t) for t in tracks))
+                    return tracks
+        with profiling.span('read_gpx', file=filename) as span:
+            tracks = read_gpx(filename)
+            span.set(points=sum(len(t) for t in tracks))
+    except (GPXReadError, EnvironmentError):
+        return None
+
+    with profiling.span('summary', file=filename):
+        for track in tracks:
+            track.summary
+    with profiling.span('simplify', file=filename):
+        for track in tracks:
+            for segment in track.segments:
+                segment.rank
+    if cache:
+        try:
+            with profiling.span('cache.put', file=filename):
+                cache.put(filename, tracks, stamp)
+        except EnvironmentError:
+            pass
+    return tracks
+
+
+def digest_file(filename, cache_dir=None):
+    # runs in a worker process: dedup.content_digest of filename, which
+    # decompresses and reads all of it, so it is kept in the track cache
+    # for as long as the file is unchanged
+    if not cache_dir:
+        return content_digest(filename)
+    cache = TrackCache(cache_dir)
+    try:
+        digest = cache.get_digest(filename)
+        if digest is not None:
+            return digest
+        stamp = cache.stamp(filename)
+    except EnvironmentError:
+        return None
+    digest = content_digest(filename)
+    if digest is not None:
+        try:
+            cache.put_digest(filename, digest, stamp)
+        except EnvironmentError:
+            pass
+    return digest
+
+
+def trim_cache(cache_dir):
+    TrackCache(cache_dir).trim()
+
+
+class GPXLoader:
+    # Runs work(filename) on a pool of worker processes, driven from the
+    # GLib main loop. Files wait in a queue of their own and only a few per
+    # worker are handed to the pool, so prioritize() and cancel_files()
+    # still apply to everything not yet started. Results are collected
+    # every DISPATCH_INTERVAL_MS and handed over in one batch.
+
+    def __init__(self, on_loaded, on_progress=None, workers=None, cache_dir=None, work=None, check=None):
+        # on_loaded([(filename, tracks or None), ...]) and
+        # on_progress(done, total) are always called from the main loop.
+        # work(filename) runs in the workers, by default it parses the file.
+        # With check, each file is hashed before that, and skipped unless
+        # check(filename, dedup.content_digest) returns True. Digests are
+        # kept in the track cache, see digest_file
+        self._on_loaded = on_loaded
+        self._on_progress = on_progress
+        self._cache_dir = cache_dir
+        self._check = check
+        self._work = work or functools.partial(parse_file, cache_dir=cache_dir)
+        self._digest = functools.partial(digest_file, cache_dir=cache_dir)
+        if profiling.enabled:
+            self._work = functools.partial(profiling.collect, self._work)
+            self._digest = functools.partial(profiling.collect, self._digest)
+        self._workers = workers or os.cpu_count() or 1
+        self._executor = None
+        # heap of [priority, filename, checking]; entries are replaced
+        # rather than moved, the old one gets filename None
+        self._queue = []
+        self._queued = {}
+        self._order = itertools.count()
+        # future -> (filename, checking, priority) for work in the pool
+        self._pending = {}
+        # future -> done(result or None) for reload() and call()
+        self._reloading = {}
+        self._finished = SimpleQueue()
+        self._source_id = None
+        self._done = 0
+        self._total = 0
+
+    def is_loading(self):
+        return bool(self._pending or self._queued)
+
+    def load(self, filenames):
+        # queued behind the files already waiting, in the order given;
+        # files named twice, or already waiting or loading, are left out
+        loading = {filename for filename, checking, priority in self._pending.values()}
+        filenames = [f for f in dict.fromkeys(filenames) if f not in self._queued and f not in loading]
+        if not filenames:
+            return
+        if self._executor is None:
+            self._start_pool()
+
+        for filename in filenames:
+            self._enqueue(filename, (1, next(self._order)), bool(self._check))
+        self._total += len(filenames)
+        self._fill()
+
+        self._start_dispatch()
+        self._report_progress()
+
+    def reload(self, filename, done):
+        # parses filename again for tracks already shown, without hashing
+        # it, counting it as progress or waiting in the queue: only the
+        # files already in the pool are ahead of it. done(tracks or None)
+        # is called from the main loop
+        self._call(done, self._work, filename)
+
+    def call(self, done, fn, *args):
+        # runs fn(*args) in the pool like reload; fn has to be picklable,
+        # and done(result) gets None if it raised
+        if profiling.enabled:
+            fn = functools.partial(profiling.collect, fn)
+        self._call(done, fn, *args)
+
+    def _call(self, done, fn, *args):
+        if self._executor is None:
+            self._start_pool()
+        future = self._pool_submit(fn, *args)
+        self._reloading[future] = done
+        future.add_done_callback(self._finished.put)
+        self._start_dispatch()
+
+    def prioritize(self, filenames):
+        # moves the waiting files among filenames to the front of the
+        # queue in the order given, ahead of those prioritized before
+        generation = -next(self._order)
+        for i, filename in enumerate(filenames):
+            entry = self._queued.get(filename)
+            if entry is not None:
+                entry[1] = None
+                self._enqueue(filename, (0, generation, i), entry[2])
+        self._fill()
+
+    def cancel_files(self, filenames):
+        # drops filenames, whether waiting or already in a worker. Their
+        # results are never passed to on_loaded
+        filenames = set(filenames)
+        cancelled = 0
+        for filename in filenames:
+            entry = self._queued.pop(filename, None)
+            if entry is not None:
+                entry[1] = None
+                cancelled += 1
+        for future, (filename, checking, priority) in list(self._pending.items()):
+            if filename in filenames:
+                future.cancel()
+                del self._pending[future]
+                cancelled += 1
+        if cancelled:
+            self._total -= cancelled
+            self._fill()
+            self._report_progress()
+
+    def _enqueue(self, filename, priority, checking):
+        entry = [priority, filename, checking]
+        self._queued[filename] = entry
+        heapq.heappush(self._queue, entry)
+
+    def _fill(self):
+        # a few files per worker, so that one is always ready to start
+        while self._queue and len(self._pending) < self._workers * IN_FLIGHT_PER_WORKER:
+            priority, filename, checking = heapq.heappop(self._queue)
+            if filename is None:
+                continue
+            del self._queued[filename]
+            self._submit(filename, checking, priority)
+
+    def _start_pool(self):
+        # spawn rather than fork, the parent is a threaded GTK process
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context('spawn'))
+
+    def _pool_submit(self, fn, *args):
+        try:
+            return self._executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # a worker died; what it had is reported as failed in
+            # _dispatch, everything after goes to a new pool
+            self._executor.shutdown(wait=False)
+            self._start_pool()
+            return self._executor.submit(fn, *args)
+
+    def _start_dispatch(self):
+        if self._source_id is None:
+            self._source_id = GLib.timeout_add(DISPATCH_INTERVAL_MS, self._dispatch)
+
+    def _submit(self, filename, checking, priority):
+        future = self._pool_submit(self._digest if checking else self._work, filename)
+        self._pending[future] = (filename, checking, priority)
+        future.add_done_callback(self._finished.put)
+
+    def cancel(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._queue.clear()
+        self._queued.clear()
+        self._finish()
+        # reloads are for tracks still shown, so they go on
+        if self._reloading:
+            self._start_dispatch()
+
+    def shutdown(self):
+        for future in self._reloading:
+            future.cancel()
+        self._reloading.clear()
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _dispatch(self):
+        batch = []
+        reloaded = []
+        skipped = 0
+        while True:
+            try:
+                future = self._finished.get_nowait()
+            except Empty:
+                break
+            done = self._reloading.pop(future, None)
+            filename, checking, priority = self._pending.pop(future, (None, False, None))
+            # cancelled, or already dropped by cancel()
+            if (filename is None and done is None) or future.cancelled():
+                continue
+            try:
+                result = future.result()
+            except Exception:
+                # the worker died or the result couldn't be pickled: the
+                # file counts as unreadable
+                result = None
+            else:
+                if profiling.enabled:
+                    result, events = result
+                    profiling.merge(events)
+            if done is not None:
+                reloaded.append((done, result))
+            elif not checking:
+                batch.append((filename, result))
+            # a file that can't be hashed is parsed anyway, to report why.
+            # It keeps its place, ahead of files not yet hashed
+            elif result is None or self._check(filename, result):
+                self._enqueue(filename, priority, False)
+            else:
+                skipped += 1
+        self._fill()
+
+        self._done += len(batch) + skipped
+        if batch:
+            self._on_loaded(batch)
+        for done, result in reloaded:
+            done(result)
+
+        if self.is_loading():
+            self._report_progress()
+            return True
+        # the files are all loaded; reloads don't count, they read
+        # through the cache rather than add to it
+        if self._total:
+            self._done = 0
+            self._total = 0
+            self._report_progress()
+            if self._cache_dir:
+                self._pool_submit(trim_cache, self._cache_dir)
+        if self._reloading:
+            return True
+        self._source_id = None
+        return False
+
+    def _finish(self):
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+        self._done = 0
+        self._total = 0
+        self._report_progress()
+
+    def _report_progress(self):
+        if self._on_progress:
+            self._on_progress(self._done, self._total)
@@ -0,0 +1,174 @@
+#
+#  memory.py - Keeping the point data of loaded tracks within a budget
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import os
+import functools
+from collections import OrderedDict
+
+from .reader import Segment
+from . import simplify
+
+# megabytes of point data kept before tracks are evicted, see
+# TrackMemory, and the environment variable that overrides it
+DEFAULT_BUDGET_MB = 512
+BUDGET_VARIABLE = 'GPXVIEWER_MEMORY_MB'
+
+# an evicted track keeps the points of this simplification level, enough
+# to draw it at this zoom and below without reloading
+COARSE_LEVEL = 10
+
+
+def budget_from_environment():
+    try:
+        return int(float(os.environ[BUDGET_VARIABLE]) * 2 ** 20)
+    except (KeyError, ValueError):
+        return DEFAULT_BUDGET_MB * 2 ** 20
+
+
+def track_bytes(track):
+    return sum(s.lat.nbytes + s.lon.nbytes + s.ele.nbytes + s.time.nbytes + s.rank.nbytes
+               for s in track.segments)
+
+
+def track_shape(track):
+    # the point count of each segment and the start time, which a
+    # reloaded track must match to be the one that was evicted
+    start = track.summary.start_time
+    return [len(s) for s in track.segments], None if start is None or start != start else start
+
+
+def coarse_segment(segment, lvl=COARSE_LEVEL):
+    # the levels nest, so these are all the points drawn at lvl and below
+    keep = segment.rank >= simplify.tolerance(lvl)
+    return Segment(segment.lat[keep], segment.lon[keep], segment.ele[keep], segment.time[keep],
+                   segment.rank[keep])
+
+
+class TrackMemory:
+    # Tracks holding all their points, in least recently used order. When
+    # they take more than the budget, trim() swaps the points of the
+    # oldest for the coarse polyline of COARSE_LEVEL; the summary and the
+    # boxes in the spatial index are kept. need() brings the points back
+    # in the background with reload(filename, done), such as
+    # GPXLoader.reload, which calls done(tracks or None) later from the
+    # main loop. A file is parsed once for all its evicted tracks, and
+    # on_restored(restored, lost) is then called with the sets of tracks
+    # given back their points and of those that couldn't be.
+
+    def __init__(self, reload, on_restored=None, budget=None):
+        self.budget = budget if budget is not None else budget_from_environment()
+        self._reload = reload
+        self._on_restored = on_restored
+        # track -> (filename, index in the file), and its track_shape
+        self._sources = {}
+        self._shapes = {}
+        self._full = OrderedDict()
+        self._coarse = {}
+        # files being parsed again, and tracks whose file failed to
+        # give their points back; need() doesn't ask for those again
+        self._reloading = set()
+        self._lost = set()
+        self._full_bytes = 0
+        self._coarse_bytes = 0
+
+    def usage(self):
+        return self._full_bytes + self._coarse_bytes
+
+    def is_evicted(self, track):
+        return track in self._coarse
+
+    def is_lost(self, track):
+        return track in self._lost
+
+    def add(self, track, filename, index):
+        self._sources[track] = (filename, index)
+        self._shapes[track] = track_shape(track)
+        size = track_bytes(track)
+        self._full[track] = size
+        self._full_bytes += size
+
+    def point_counts(self, track):
+        # the points of each segment of track, evicted or not
+        return self._shapes[track][0]
+
+    def source(self, track):
+        # (filename, index in the file) of track, None if it isn't held
+        return self._sources.get(track)
+
+    def remove(self, track):
+        self._sources.pop(track, None)
+        self._shapes.pop(track, None)
+        self._full_bytes -= self._full.pop(track, 0)
+        self._coarse_bytes -= self._coarse.pop(track, 0)
+        self._lost.discard(track)
+
+    def need(self, track, lvl=None):
+        # true if track can be drawn at simplification level lvl, all of
+        # it when lvl is None. If not, its file is parsed again unless
+        # that is under way or failed already, see is_lost
+        if track in self._full:
+            self._full.move_to_end(track)
+            return True
+        if track not in self._coarse:
+            return True
+        if lvl is not None and lvl <= COARSE_LEVEL:
+            return True
+        filename, index = self._sources[track]
+        if track not in self._lost and filename not in self._reloading:
+            self._reloading.add(filename)
+            self._reload(filename, functools.partial(self._restore, filename))
+        return False
+
+    def _restore(self, filename, tracks):
+        self._reloading.discard(filename)
+        restored = set()
+        lost = set()
+        # every track of the file evicted by now, removed ones are gone
+        for track in [t for t in self._coarse if self._sources[t][0] == filename]:
+            index = self._sources[track][1]
+            # gone, or changed since it was opened; other points would
+            # differ from those in the heatmap, the spatial index and the
+            # duplicate fingerprints
+            if not tracks or index >= len(tracks) or track_shape(tracks[index]) != self._shapes[track]:
+                self._lost.add(track)
+                lost.add(track)
+                continue
+            track.segments = tracks[index].segments
+            self._coarse_bytes -= self._coarse.pop(track)
+            size = track_bytes(track)
+            self._full[track] = size
+            self._full_bytes += size
+            restored.add(track)
+        if self._on_restored and (restored or lost):
+            self._on_restored(restored, lost)
+
+    def trim(self, keep=()):
+        # evicts the least recently used tracks not in keep until within budget
+        for track in list(self._full):
+            if self.usage() <= self.budget:
+                break
+            if track in keep:
+                continue
+            self._full_bytes -= self._full.pop(track)
+            track.segments = [coarse_segment(s) for s in track.segments]
+            size = track_bytes(track)
+            self._coarse[track] = size
+            self._coarse_bytes += size
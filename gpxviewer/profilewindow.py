@@ -0,0 +1,127 @@
+#
+#  profilewindow.py - Showing the timing spans of GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import os
+
+from gi.repository import Gtk
+
+from . import profiling
+
+import gettext
+_ = gettext.gettext
+
+
+def _text_columns(tv, titles):
+    for i, title in enumerate(titles):
+        column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=i)
+        column.set_resizable(True)
+        column.set_sort_column_id(i)
+        tv.append_column(column)
+
+
+class ProfileWindow(Gtk.Window):
+    def __init__(self, parent=None):
+        Gtk.Window.__init__(self, title=_("Profiling Report"))
+        self.set_transient_for(parent)
+        self.resize(700, 400)
+        self.connect("delete-event", lambda *a: self.hide() or True)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        box.set_border_width(4)
+        self.add(box)
+
+        toolbar = Gtk.Box(spacing=4)
+        box.pack_start(toolbar, False, False, 0)
+        for label, handler in ((_("_Refresh"), self.refresh),
+                               (_("_Clear"), self.clear_clicked),
+                               (_("Save _Report..."), self.save_clicked),
+                               (_("Save _Trace..."), self.save_clicked)):
+            button = Gtk.Button.new_with_mnemonic(label)
+            button.connect("clicked", handler)
+            toolbar.pack_start(button, False, False, 0)
+        self.traceButton = button
+        self.peakLabel = Gtk.Label(xalign=1)
+        toolbar.pack_end(self.peakLabel, False, False, 0)
+
+        notebook = Gtk.Notebook()
+        box.pack_start(notebook, True, True, 0)
+
+        # stage, count, total, mean, max [ms], points
+        self.stages = Gtk.ListStore(str, int, str, str, str, int)
+        tv = Gtk.TreeView(model=self.stages)
+        _text_columns(tv, (_("Stage"), _("Count"), _("Total [ms]"), _("Mean [ms]"), _("Max [ms]"), _("Points")))
+        sw = Gtk.ScrolledWindow()
+        sw.add(tv)
+        notebook.append_page(sw, Gtk.Label(_("Stages")))
+
+        # file or stage, time [ms], points
+        self.files = Gtk.TreeStore(str, str, int)
+        tv = Gtk.TreeView(model=self.files)
+        _text_columns(tv, (_("File"), _("Time [ms]"), _("Points")))
+        sw = Gtk.ScrolledWindow()
+        sw.add(tv)
+        notebook.append_page(sw, Gtk.Label(_("Files")))
+
+        self.refresh()
+
+    def refresh(self, *args):
+        report = profiling.report()
+
+        self.stages.clear()
+        for name, s in sorted(report['stages'].items(), key=lambda i: -i[1]['total']):
+            self.stages.append([name, s['count'], '%.1f' % (s['total'] * 1000),
+                                '%.2f' % (s['total'] * 1000 / s['count']), '%.1f' % (s['max'] * 1000), s['points']])
+
+        self.files.clear()
+        for filename, f in sorted(report['files'].items()):
+            total = sum(f['stages'].values())
+            parent = self.files.append(None, [os.path.basename(filename), '%.1f' % (total * 1000), f['points']])
+            for name, duration in sorted(f['stages'].items()):
+                self.files.append(parent, [name, '%.1f' % (duration * 1000), 0])
+
+        peak = report['peak_memory']
+        if peak:
+            self.peakLabel.set_text(_("Peak memory: %(main).0f MB, workers %(workers).0f MB") % {
+                "main": peak.get(os.getpid(), 0) / 2 ** 20,
+                "workers": max([v for k, v in peak.items() if k != os.getpid()] or [0]) / 2 ** 20})
+        else:
+            self.peakLabel.set_text('')
+
+    def clear_clicked(self, *args):
+        profiling.clear()
+        self.refresh()
+
+    def save_clicked(self, button):
+        trace = button is self.traceButton
+        chooser = Gtk.FileChooserDialog(title=_("Save Profile"), action=Gtk.FileChooserAction.SAVE, parent=self)
+        chooser.add_button(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL)
+        chooser.add_button(Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        chooser.set_do_overwrite_confirmation(True)
+        chooser.set_current_name('gpxviewer' + (profiling.TRACE_SUFFIX if trace else '.json'))
+        if chooser.run() == Gtk.ResponseType.OK:
+            filename = chooser.get_filename()
+            # the format follows the name, so keep the suffix of the button
+            if trace and not filename.endswith(profiling.TRACE_SUFFIX):
+                filename += profiling.TRACE_SUFFIX
+            elif not trace and filename.endswith(profiling.TRACE_SUFFIX):
+                filename = filename[:-len(profiling.TRACE_SUFFIX)] + '.json'
+            profiling.dump(filename)
+        chooser.destroy()
@@ -0,0 +1,213 @@
+#
+#  profiling.py - Timing spans around the slow stages of GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Profiling is on when GPXVIEWER_PROFILE is set (gpxviewer --profile sets
+#  it). Its value may name a file the spans are written to on exit: a
+#  Chrome trace if it ends in .trace.json, a JSON report otherwise. Worker
+#  processes inherit the variable and send their spans back with their
+#  results, see collect().
+#
+#  Needs neither GTK nor a display, so nothing here may import gi.
+#
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ENVIRONMENT_VARIABLE = 'GPXVIEWER_PROFILE'
+TRACE_SUFFIX = '.trace.json'
+
+enabled = False
+output = None
+
+_events = []
+_lock = threading.Lock()
+
+
+def _peak_memory():
+    # bytes, or None where the platform can't tell
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start', 'wall')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        event = {
+            'name': self.name,
+            'start': self.wall,
+            'duration': duration,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'peak_memory': _peak_memory(),
+            'args': self.args,
+        }
+        with _lock:
+            _events.append(event)
+        return False
+
+
+class _NoSpan:
+    # what span() hands out while profiling is off
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **args):
+    # with span('read_gpx', file=filename) as s: ... s.set(points=n)
+    if not enabled:
+        return _NO_SPAN
+    return _Span(name, args)
+
+
+def enable(path=None):
+    global enabled, output
+    enabled = True
+    output = path or None
+    if output:
+        atexit.register(_dump_on_exit)
+
+
+def _dump_on_exit():
+    try:
+        dump(output)
+    except EnvironmentError as e:
+        sys.stderr.write('gpxviewer: could not write profile to %s: %s\n' % (output, e))
+
+
+def collect(work, *args):
+    # runs work(*args) in a worker and returns its result together with
+    # the spans it recorded, for merge() in the parent
+    with _lock:
+        mark = len(_events)
+    result = work(*args)
+    with _lock:
+        events = _events[mark:]
+        del _events[mark:]
+    return result, events
+
+
+def merge(events):
+    with _lock:
+        _events.extend(events)
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def clear():
+    with _lock:
+        del _events[:]
+
+
+def report():
+    # {'stages': {name: {...}}, 'files': {filename: {...}}, 'peak_memory': {pid: bytes}}
+    stages = {}
+    files = {}
+    peak = {}
+    for e in events():
+        stage = stages.get(e['name'])
+        if stage is None:
+            stage = stages[e['name']] = {'count': 0, 'total': 0., 'max': 0., 'points': 0}
+        stage['count'] += 1
+        stage['total'] += e['duration']
+        stage['max'] = max(stage['max'], e['duration'])
+        stage['points'] += e['args'].get('points', 0)
+
+        filename = e['args'].get('file')
+        if filename is not None:
+            f = files.get(filename)
+            if f is None:
+                f = files[filename] = {'points': 0, 'stages': {}}
+            f['points'] = max(f['points'], e['args'].get('points', 0))
+            f['stages'][e['name']] = f['stages'].get(e['name'], 0.) + e['duration']
+
+        if e['peak_memory'] is not None:
+            peak[e['pid']] = max(peak.get(e['pid'], 0), e['peak_memory'])
+    return {'stages': stages, 'files': files, 'peak_memory': peak}
+
+
+def chrome_trace():
+    # the Trace Event Format read by chrome://tracing and Perfetto
+    trace = []
+    for e in events():
+        args = dict(e['args'])
+        if e['peak_memory'] is not None:
+            args['peak_memory'] = e['peak_memory']
+        trace.append({
+            'name': e['name'],
+            'ph': 'X',
+            'ts': e['start'] * 1e6,
+            'dur': e['duration'] * 1e6,
+            'pid': e['pid'],
+            'tid': e['tid'],
+            'args': args,
+        })
+    return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+
+def dump(path):
+    data = chrome_trace() if path.endswith(TRACE_SUFFIX) else dict(report(), events=events())
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1, default=str)
+
+
+if os.environ.get(ENVIRONMENT_VARIABLE):
+    value = os.environ[ENVIRONMENT_VARIABLE]
+    # only the main process writes the file, workers send their spans back
+    enable(value if value != '1' and multiprocessing.parent_process() is None else None)
@@ -0,0 +1,241 @@
+#
+#  reader.py - Streaming GPX reader for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import os
+from array import array
+from datetime import datetime, timezone
+from xml.etree.ElementTree import iterparse, ParseError
+
+import numpy
+
+from .summary import summarize, extend_summary
+from . import simplify
+from . import archive
+
+NAN = float('nan')
+
+
+class GPXReadError(Exception):
+    pass
+
+
+class Segment:
+    # latitude, longitude and elevation in degrees and metres, time in
+    # seconds since the epoch. Missing elevations and times are NaN.
+    __slots__ = ('lat', 'lon', 'ele', 'time', '_rank')
+
+    def __init__(self, lat, lon, ele, time, rank=None):
+        self.lat = numpy.asarray(lat, dtype=numpy.float64)
+        self.lon = numpy.asarray(lon, dtype=numpy.float64)
+        self.ele = numpy.asarray(ele, dtype=numpy.float64)
+        self.time = numpy.asarray(time, dtype=numpy.float64)
+        self._rank = rank
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def rank(self):
+        # see simplify.rank
+        if self._rank is None:
+            self._rank = simplify.rank(self.lat, self.lon)
+        return self._rank
+
+    def extend(self, lat, lon, ele, time):
+        self.lat = numpy.concatenate([self.lat, numpy.asarray(lat, dtype=numpy.float64)])
+        self.lon = numpy.concatenate([self.lon, numpy.asarray(lon, dtype=numpy.float64)])
+        self.ele = numpy.concatenate([self.ele, numpy.asarray(ele, dtype=numpy.float64)])
+        self.time = numpy.concatenate([self.time, numpy.asarray(time, dtype=numpy.float64)])
+        # every rank can change with new points
+        self._rank = None
+
+
+class Track:
+    __slots__ = ('name', 'segments', '_summary')
+
+    def __init__(self, name=None, segments=None, summary=None):
+        self.name = name
+        self.segments = segments if segments is not None else []
+        self._summary = summary
+
+    def __len__(self):
+        return sum(len(s) for s in self.segments)
+
+    @property
+    def summary(self):
+        if self._summary is None:
+            self._summary = summarize(self)
+        return self._summary
+
+    def extend(self, index, lat, lon, ele, time):
+        # appends points to segment index, or to a new segment when index
+        # is len(segments), and updates the summary, if there is one yet,
+        # from the new points alone. Returns where the new points start
+        if index == len(self.segments):
+            self.segments.append(Segment([], [], [], []))
+        segment = self.segments[index]
+        start = len(segment)
+        points = len(self)
+        segment.extend(lat, lon, ele, time)
+        if self._summary is not None and len(segment) > start:
+            # from the point before, for the leg joining them on
+            first = max(start - 1, 0)
+            tail = Segment(segment.lat[first:], segment.lon[first:], segment.ele[first:], segment.time[first:])
+            self._summary = extend_summary(self._summary, points, tail, len(segment) - start)
+        return start
+
+
+def _local(tag):
+    return tag.rpartition('}')[2]
+
+
+def parse_time(text):
+    text = text.strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    t = datetime.fromisoformat(text)
+    # GPX times are UTC unless they say otherwise
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+
+def read_point(elem):
+    # latitude, longitude, elevation and time of a finished trkpt element
+    e = t = NAN
+    for child in elem:
+        ctag = _local(child.tag)
+        if ctag == 'ele' and child.text and child.text.strip():
+            e = float(child.text)
+        elif ctag == 'time' and child.text and child.text.strip():
+            t = parse_time(child.text)
+    return float(elem.get('lat')), float(elem.get('lon')), e, t
+
+
+def _iterparse_tracks(source):
+    tracks = []
+    track = None
+    seg_elem = None
+    lat = lon = ele = time = None
+    root = None
+
+    for event, elem in iterparse(source, events=('start', 'end')):
+        tag = _local(elem.tag)
+        if event == 'start':
+            # well formed XML of some other kind would have no tracks
+            if root is None:
+                root = tag
+                if root != 'gpx':
+                    raise GPXReadError('not a GPX document, its root element is %s' % root)
+            if tag == 'trk':
+                track = Track()
+            elif tag == 'trkseg' and track is not None:
+                seg_elem = elem
+                lat, lon, ele, time = array('d'), array('d'), array('d'), array('d')
+            continue
+
+        if tag == 'trkpt' and seg_elem is not None:
+            la, lo, e, t = read_point(elem)
+            lat.append(la)
+            lon.append(lo)
+            ele.append(e)
+            time.append(t)
+            # drop finished points so memory stays flat however long the
+            # segment is
+            del seg_elem[:]
+        elif tag == 'trkseg' and seg_elem is not None:
+            if lat:
+                track.segments.append(Segment(lat, lon, ele, time))
+            seg_elem = None
+            elem.clear()
+        elif tag == 'trk' and track is not None:
+            for child in elem:
+                if _local(child.tag) == 'name':
+                    track.name = child.text
+                    break
+            tracks.append(track)
+            track = None
+            elem.clear()
+        elif tag in ('wpt', 'rte'):
+            elem.clear()
+    return tracks
+
+
+def from_gpxpy(track):
+    segments = []
+    for segment in track.segments:
+        if not segment.points:
+            continue
+        points = segment.points
+        segments.append(Segment(
+            [p.latitude for p in points],
+            [p.longitude for p in points],
+            [NAN if p.elevation is None else p.elevation for p in points],
+            [NAN if p.time is None else p.time.timestamp() for p in points]))
+    return Track(track.name, segments)
+
+
+def _read_with_gpxpy(f):
+    from gpxpy import parse
+    from gpxpy.gpx import GPXException
+
+    try:
+        return [from_gpxpy(t) for t in parse(f).tracks]
+    except GPXException as e:
+        raise GPXReadError(str(e)) from e
+
+
+def _read_document(filename):
+    try:
+        with archive.open_gpx(filename) as f:
+            return _iterparse_tracks(f)
+    except (ParseError, ValueError, TypeError):
+        # gpxpy copes with more timestamp formats and broken documents
+        with archive.open_gpx(filename) as f:
+            return _read_with_gpxpy(f)
+
+
+def _read_archive(filename):
+    # every GPX file of the archive, in one pass over it
+    tracks = []
+    found = False
+    for name, f in archive.streams(filename):
+        found = True
+        try:
+            tracks.extend(_iterparse_tracks(f))
+        except (ParseError, ValueError, TypeError):
+            # the stream has moved on, so gpxpy gets the member again
+            with archive.open_gpx(os.path.join(filename, name)) as f:
+                tracks.extend(_read_with_gpxpy(f))
+    if not found:
+        raise GPXReadError('%s has no GPX files' % filename)
+    return tracks
+
+
+def read_gpx(filename):
+    # filename may be gzip, bzip2 or xz compressed, a whole zip or tar
+    # archive, or a file inside one named as archive.py describes
+    try:
+        if archive.is_archive(filename):
+            return _read_archive(filename)
+        return _read_document(filename)
+    except archive.ERRORS as e:
+        raise GPXReadError(str(e)) from e
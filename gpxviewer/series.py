@@ -0,0 +1,86 @@
+#
+#  series.py - Per point values along a track, for profiles and readouts
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Needs neither GTK nor a display, so nothing here may import gi.
+#
+import numpy
+
+from .summary import segment_distances
+from . import simplify
+from . import spatial
+
+
+class TrackSeries:
+    # Every point of a track in one set of arrays, in order, with the
+    # distance from the start in metres and the speed in m/s over the leg
+    # arriving at each point. The first point of every segment and points
+    # without a later time than the one before have no speed (NaN); the
+    # gaps between segments add no distance.
+
+    def __init__(self, track):
+        segments = [s for s in track.segments if len(s)]
+        self.lat = numpy.concatenate([s.lat for s in segments] or [[]])
+        self.lon = numpy.concatenate([s.lon for s in segments] or [[]])
+        self.ele = numpy.concatenate([s.ele for s in segments] or [[]])
+        self.time = numpy.concatenate([s.time for s in segments] or [[]])
+        # index of the first point of every segment
+        lengths = numpy.array([len(s) for s in segments], dtype=numpy.intp)
+        self.starts = numpy.cumsum(lengths) - lengths
+
+        legs = numpy.concatenate([numpy.r_[0., segment_distances(s)] for s in segments] or [[]])
+        self.distance = numpy.cumsum(legs)
+        seconds = numpy.diff(self.time, prepend=numpy.nan)
+        seconds[self.starts] = numpy.nan
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            self.speed = numpy.where(seconds > 0, legs / seconds, numpy.nan)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def elapsed(self):
+        # seconds since the first timed point, NaN where untimed
+        timed = self.time[~numpy.isnan(self.time)]
+        return self.time - (timed[0] if len(timed) else 0.)
+
+
+class TrackPointIndex:
+    # A TrackSeries of a track with a spatial.PointGrid of its points, to
+    # find the point under the pointer. Built when first needed, and
+    # again once the points change.
+
+    def __init__(self, track):
+        self.track = track
+        self.series = TrackSeries(track)
+        self.grid = spatial.PointGrid(*simplify.project(self.series.lat, self.series.lon))
+        # the point arrays these were built from, see is_current
+        self._points = [s.lat for s in track.segments]
+
+    def is_current(self, track):
+        # false for another track, or once the points have been swapped,
+        # added to or evicted
+        return track is self.track and len(track.segments) == len(self._points) and \
+            all(s.lat is lat for s, lat in zip(track.segments, self._points))
+
+    def nearest(self, lat, lon, radius):
+        # index in series of the point nearest to lat, lon and at most
+        # radius pixels of the zoom 0 world away, or None
+        x, y = simplify.project(lat, lon)
+        return self.grid.nearest(float(x), float(y), radius)
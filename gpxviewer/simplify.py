@@ -0,0 +1,136 @@
+#
+#  simplify.py - Level of detail for drawing tracks on the map
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import math
+
+import numpy
+
+# Douglas-Peucker is run once per segment, recording for every point the
+# tolerance at which it stops being needed. Each zoom level then just keeps
+# the points ranked above that level's tolerance, so the levels nest and
+# the number of drawn vertices stays about the same at every zoom.
+
+# maximum error of a simplified line, in screen pixels
+TOLERANCE_PX = 1.0
+# beyond this zoom the full resolution line is drawn
+MAX_ZOOM = 17
+TILE_SIZE = 256
+
+
+def project(lat, lon):
+    # spherical mercator, in pixels of the zoom 0 world
+    x = (numpy.asarray(lon) + 180.) / 360. * TILE_SIZE
+    lat = numpy.radians(numpy.clip(lat, -85.0511, 85.0511))
+    y = (1 - numpy.log(numpy.tan(lat) + 1 / numpy.cos(lat)) / math.pi) / 2 * TILE_SIZE
+    return x, y
+
+
+def tolerance(zoom):
+    return TOLERANCE_PX / 2 ** zoom
+
+
+def rank(lat, lon):
+    n = len(lat)
+    r = numpy.zeros(n, dtype=numpy.float32)
+    if not n:
+        return r
+    r[0] = r[-1] = numpy.inf
+
+    x, y = project(lat, lon)
+    min_tolerance = tolerance(MAX_ZOOM)
+    stack = [(0, n - 1, numpy.inf)]
+    while stack:
+        a, b, parent = stack.pop()
+        if b - a < 2:
+            continue
+        dx = x[b] - x[a]
+        dy = y[b] - y[a]
+        px = x[a + 1:b] - x[a]
+        py = y[a + 1:b] - y[a]
+        norm = math.hypot(dx, dy)
+        if norm:
+            d = numpy.abs(px * dy - py * dx) / norm
+        else:
+            d = numpy.hypot(px, py)
+        i = int(d.argmax())
+        if d[i] < min_tolerance:
+            continue
+        # a point is never ranked above the point that split its range, so
+        # every level is a subset of the levels above it
+        k = a + 1 + i
+        r[k] = min(d[i], parent)
+        stack.append((a, k, r[k]))
+        stack.append((k, b, r[k]))
+    return r
+
+
+def level(zoom):
+    # zoom levels sharing a level draw the same points
+    return min(int(zoom), MAX_ZOOM + 1)
+
+
+def level_indices(ranks, lvl):
+    if lvl > MAX_ZOOM:
+        return None
+    return numpy.flatnonzero(ranks >= tolerance(lvl))
+
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: the indices of threshold points of the
+    # line y(x) that keep its shape, for plotting series longer than the
+    # chart is wide
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return numpy.arange(n)
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+
+    # threshold - 2 buckets between the first and last point, which are kept
+    edges = numpy.linspace(1, n - 1, threshold - 1).astype(numpy.intp)
+    indices = numpy.empty(threshold, dtype=numpy.intp)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < threshold - 1 else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # twice the area of the triangle from the last kept point, through
+        # each candidate, to the average of the next bucket
+        area = numpy.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def densify(x, y, spacing):
+    # the polyline x, y with points added so that consecutive points are
+    # no more than spacing apart along either axis
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    if len(x) < 2:
+        return x, y
+    steps = numpy.ceil(numpy.maximum(numpy.abs(numpy.diff(x)), numpy.abs(numpy.diff(y))) / spacing)
+    steps = numpy.maximum(steps, 1).astype(numpy.intp)
+    leg = numpy.repeat(numpy.arange(len(steps)), steps)
+    t = (numpy.arange(len(leg)) - numpy.repeat(numpy.cumsum(steps) - steps, steps)) / numpy.repeat(steps, steps)
+    return (numpy.append(x[leg] + (x[leg + 1] - x[leg]) * t, x[-1]),
+            numpy.append(y[leg] + (y[leg + 1] - y[leg]) * t, y[-1]))
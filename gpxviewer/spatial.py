@@ -0,0 +1,156 @@
+#
+#  spatial.py - Spatial lookups over loaded tracks for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+import numpy
+
+INITIAL_CAPACITY = 64
+# points of a track per PointGrid cell, and the smallest cell, in pixels
+# of the zoom 0 world, for tracks that never move
+POINTS_PER_CELL = 16
+MIN_CELL = 1e-9
+
+
+class BoxIndex:
+    # Bounding boxes (min_lat, min_lon, max_lat, max_lon) of any number of
+    # items, several boxes per item allowed. The boxes are packed into one
+    # array, so a query is a handful of vectorised comparisons: around
+    # 100 us for 10,000 tracks, which no tree would improve on noticeably.
+
+    def __init__(self):
+        self._boxes = numpy.full((INITIAL_CAPACITY, 4), numpy.nan)
+        self._owners = [None] * INITIAL_CAPACITY
+        self._rows = {}
+        self._free = []
+        self._used = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, item):
+        return item in self._rows
+
+    def _allocate(self):
+        if self._free:
+            return self._free.pop()
+        if self._used == len(self._boxes):
+            grow = len(self._boxes)
+            self._boxes = numpy.concatenate([self._boxes, numpy.full((grow, 4), numpy.nan)])
+            self._owners.extend([None] * grow)
+        self._used += 1
+        return self._used - 1
+
+    def insert(self, item, boxes):
+        rows = self._rows.setdefault(item, [])
+        for box in boxes:
+            row = self._allocate()
+            self._boxes[row] = box
+            self._owners[row] = item
+            rows.append(row)
+
+    def remove(self, item):
+        for row in self._rows.pop(item, ()):
+            # NaN boxes never match a query
+            self._boxes[row] = numpy.nan
+            self._owners[row] = None
+            self._free.append(row)
+
+    def intersecting(self, min_lat, min_lon, max_lat, max_lon):
+        b = self._boxes[:self._used]
+        hits = numpy.flatnonzero(
+            (b[:, 0] <= max_lat) & (b[:, 2] >= min_lat) &
+            (b[:, 1] <= max_lon) & (b[:, 3] >= min_lon))
+        owners = self._owners
+        return {owners[i] for i in hits.tolist()}
+
+
+def segment_boxes(track):
+    return [(float(s.lat.min()), float(s.lon.min()), float(s.lat.max()), float(s.lon.max()))
+            for s in track.segments if len(s)]
+
+
+def polyline_distance(x, y, xs, ys):
+    # shortest distance from (x, y) to the polyline through xs, ys
+    if len(xs) == 1:
+        return float(numpy.hypot(xs[0] - x, ys[0] - y))
+    ax, ay = xs[:-1], ys[:-1]
+    dx, dy = xs[1:] - ax, ys[1:] - ay
+    length2 = dx * dx + dy * dy
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t = numpy.clip(((x - ax) * dx + (y - ay) * dy) / length2, 0, 1)
+    t = numpy.nan_to_num(t)
+    return float(numpy.hypot(ax + t * dx - x, ay + t * dy - y).min())
+
+
+class PointGrid:
+    # The points x, y of a track bucketed into square cells, sized so
+    # that a cell along the track holds about POINTS_PER_CELL of them.
+    # The points are sorted by column and then row of their cell, so the
+    # cells of one column within a query are one slice of that order and a
+    # lookup only measures the points in the cells it covers.
+
+    def __init__(self, x, y):
+        self.x = numpy.asarray(x, dtype=numpy.float64)
+        self.y = numpy.asarray(y, dtype=numpy.float64)
+        # a track is a line, so its length rather than its area sets how
+        # many points fall in a cell
+        length = numpy.hypot(numpy.diff(self.x), numpy.diff(self.y)).sum()
+        self.cell = max(float(length) / max(len(self.x), 1) * POINTS_PER_CELL, MIN_CELL)
+        cx = numpy.floor(self.x / self.cell).astype(numpy.int64)
+        cy = numpy.floor(self.y / self.cell).astype(numpy.int64)
+        self._origin = (int(cx.min()), int(cy.min())) if len(cx) else (0, 0)
+        self._columns = int(cx.max()) - self._origin[0] + 1 if len(cx) else 0
+        self._rows = int(cy.max()) - self._origin[1] + 1 if len(cy) else 0
+        keys = (cx - self._origin[0]) * self._rows + (cy - self._origin[1])
+        self._order = numpy.argsort(keys, kind='stable')
+        self._keys = keys[self._order]
+
+    def nearest(self, x, y, radius):
+        # index of the point nearest to (x, y) no further than radius
+        # away, or None. Looks around the nearest cells first: whatever is
+        # found within a smaller radius is the nearest point
+        r = min(radius, self.cell)
+        while True:
+            best = self._nearest(x, y, r)
+            if best is not None or r >= radius:
+                return best
+            r = min(r * 4, radius)
+
+    def _nearest(self, x, y, radius):
+        c0 = max(int((x - radius) // self.cell) - self._origin[0], 0)
+        c1 = min(int((x + radius) // self.cell) - self._origin[0], self._columns - 1)
+        r0 = max(int((y - radius) // self.cell) - self._origin[1], 0)
+        r1 = min(int((y + radius) // self.cell) - self._origin[1], self._rows - 1)
+        if c0 > c1 or r0 > r1:
+            return None
+        columns = numpy.arange(c0, c1 + 1, dtype=numpy.int64) * self._rows
+        first = numpy.searchsorted(self._keys, columns + r0)
+        counts = numpy.searchsorted(self._keys, columns + r1, 'right') - first
+        total = int(counts.sum())
+        if not total:
+            return None
+        # the positions in _order of every slice, end to end
+        positions = numpy.repeat(first - numpy.cumsum(counts) + counts, counts) + numpy.arange(total)
+        candidates = self._order[positions]
+        d2 = (self.x[candidates] - x) ** 2 + (self.y[candidates] - y) ** 2
+        best = int(d2.argmin())
+        if d2[best] > radius * radius:
+            return None
+        return int(candidates[best])
@@ -1,8 +1,162 @@
+import sys
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+
+import cairo
+import numpy
+from gi.repository import GLib
+from gi.repository import Gdk
 from gi.repository import Gtk
 import matplotlib
 matplotlib.use('Agg')
-from matplotlib.backends.backend_gtk3agg import FigureCanvasGTK3Agg as FigureCanvas
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+from . import profiling
+from .simplify import lttb
+
+DPI = 96
+# more bars than this get no value labels
+MAX_DATA_LABELS = 30
+# room for one tick label, charts with more items label only some
+TICK_SPACING_PX = 100
+# line charts are decimated to about this many points before plotting
+MAX_LINE_POINTS = 1000
+# how far the pointer has to move across a profile before it zooms
+DRAG_THRESHOLD_PX = 4
+# rendered charts kept, keyed by chart, data version and size
+CACHE_SIZE = 16
+
+_cache = OrderedDict()
+# object -> number in cache keys; unlike id(), never handed to another
+# object once one is freed
+_tokens = itertools.count()
+_tokenOf = weakref.WeakKeyDictionary()
+# matplotlib's text and font caches aren't safe to share between threads,
+# so renders run one at a time, just not on the main loop
+_render_lock = threading.Lock()
+
+if sys.byteorder == 'little':
+	_ARGB32 = [2, 1, 0, 3]
+else:
+	_ARGB32 = [3, 0, 1, 2]
+
+def _render(chart, data, width, height):
+	# returns the image and, when plot returns its axes, where the x axis
+	# ended up as (left pixel, right pixel, left value, right value)
+	with _render_lock:
+		figure = Figure(figsize=(width / DPI, height / DPI), dpi=DPI, tight_layout=True)
+		canvas = FigureCanvasAgg(figure)
+		axes = chart.plot(figure, data)
+		canvas.draw()
+		rgba = numpy.asarray(canvas.buffer_rgba())
+		xaxis = None
+		if axes is not None:
+			box = axes.get_window_extent()
+			xaxis = (float(box.x0), float(box.x1)) + tuple(float(v) for v in axes.get_xlim())
+	# the figure is opaque, so premultiplied alpha is the same thing
+	pixels = numpy.ascontiguousarray(rgba[..., _ARGB32])
+	h, w = pixels.shape[:2]
+	return cairo.ImageSurface.create_for_data(pixels, cairo.FORMAT_ARGB32, w, h, w * 4), xaxis
+
+def _token(obj):
+	token = _tokenOf.get(obj)
+	if token is None:
+		token = _tokenOf[obj] = next(_tokens)
+	return token
+
+def _max_ticks(figure):
+	return max(2, int(figure.get_figwidth() * figure.dpi / TICK_SPACING_PX))
+
+class _ChartView(Gtk.DrawingArea):
+
+	def __init__(self, chart, data):
+		Gtk.DrawingArea.__init__(self)
+		self.set_size_request(300, 200)
+		self._chart = chart
+		self._data = data
+		self._key = chart.cacheKey()
+		# last (image, x axis) shown, drawn stretched while one for a new
+		# size renders
+		self._rendered = None
+		self._rendering = None
+		self._destroyed = False
+		self.connect('draw', self.on_draw)
+		self.connect('destroy', self.on_destroy)
+
+	def refresh(self):
+		# after what the chart shows has changed
+		self._data = self._chart.getData()
+		self._key = self._chart.cacheKey()
+		self.queue_draw()
+
+	def on_draw(self, widget, cr):
+		width, height = self.get_allocated_width(), self.get_allocated_height()
+		key = (self._key, width, height)
+		rendered = _cache.get(key)
+		if rendered is None:
+			self._start_render(key, width, height)
+			rendered = self._rendered
+		else:
+			_cache.move_to_end(key)
+			self._rendered = rendered
+
+		cr.set_source_rgb(1, 1, 1)
+		cr.paint()
+		if rendered is not None:
+			image = rendered[0]
+			cr.save()
+			cr.scale(width / image.get_width(), height / image.get_height())
+			cr.set_source_surface(image, 0, 0)
+			cr.paint()
+			cr.restore()
+		self.drawOverlay(cr, width, height)
+		return False
+
+	def on_destroy(self, widget):
+		# its renderings stay cached, for the window opened again
+		self._destroyed = True
+
+	def drawOverlay(self, cr, width, height):
+		pass
+
+	def xValue(self, x):
+		# the data x under widget position x, None outside the axes
+		if self._rendered is None or self._rendered[1] is None:
+			return None
+		image, (left, right, xmin, xmax) = self._rendered
+		x = x * image.get_width() / self.get_allocated_width()
+		if not left <= x <= right or right <= left:
+			return None
+		return xmin + (x - left) / (right - left) * (xmax - xmin)
+
+	def _start_render(self, key, width, height):
+		if self._rendering == key:
+			return
+		self._rendering = key
+
+		data = self._data
+
+		def run():
+			with profiling.span('stats.render', chart=self._chart.title):
+				rendered = _render(self._chart, data, width, height)
+			GLib.idle_add(done, rendered)
+
+		def done(rendered):
+			if self._destroyed:
+				return False
+			_cache[key] = rendered
+			while len(_cache) > CACHE_SIZE:
+				_cache.popitem(last=False)
+			if self._rendering == key:
+				self._rendering = None
+			self.queue_draw()
+			return False
+
+		threading.Thread(target=run, daemon=True).start()
 
 class _Chart:
 
@@ -10,9 +164,25 @@ class _Chart:
 	xlabel = ''
 	ylabel = ''
 
-	def chart(self):
+	def getData(self):
+		raise NotImplementedError
+
+	def plot(self, figure, data):
 		raise NotImplementedError
 
+	def cacheKey(self):
+		# charts of unchanged data can reuse an earlier rendering
+		return (self.__class__, self.cacheToken())
+
+	def cacheToken(self):
+		# a number for this chart alone, for as long as the process runs
+		return _token(self)
+
+	def chart(self):
+		# the data is gathered here, the figure is drawn on a thread
+		with profiling.span('stats.chart', chart=self.title):
+			return _ChartView(self, self.getData())
+
 	def chart_window(self):
 		window = Gtk.Window()
 		window.add(self.chart())
@@ -35,83 +205,241 @@ class StatBarChart(_Chart):
 	def getBarChartData(self):
 		raise NotImplementedError
 
-	def chart(self):
-		chart = Figure(tight_layout=True)
-		barchart = chart.add_subplot(111)
+	def getData(self):
+		return self.getBarChartData()
+
+	def plot(self, figure, data):
+		barchart = figure.add_subplot(111)
 		barchart.grid(linestyle=':')
 
-		labels, bar_info = self.getBarChartData()
+		labels, bar_info = data
 		x = range(len(labels))
 		bars = barchart.bar(x, bar_info)
 		barchart.set_xlabel(self.xlabel)
 		barchart.set_ylabel(self.ylabel)
-		barchart.set_xticks(x)
-		barchart.set_xticklabels(labels)
-
-		if self.show_data_labels:
-			for bar in bars:
-				height = bar.get_height()
-				barchart.annotate('%0.2f' % height,
-					xy=(bar.get_x() + bar.get_width() / 2, height),
-					xytext=(0, 3),
-					textcoords='offset points',
-					ha='center', va='bottom')
-
-		return FigureCanvas(chart)
+		ticks = _max_ticks(figure)
+		if len(labels) <= ticks:
+			barchart.set_xticks(x)
+			barchart.set_xticklabels(labels)
+		else:
+			barchart.xaxis.set_major_locator(MaxNLocator(ticks, integer=True))
+			barchart.xaxis.set_major_formatter(FuncFormatter(
+				lambda v, pos: labels[int(v)] if 0 <= int(v) < len(labels) else ''))
+
+		if self.show_data_labels and len(bars) <= MAX_DATA_LABELS:
+			barchart.bar_label(bars, fmt='%0.2f', padding=3)
 
 class LineChart(_Chart):
 
 	def getLineChartData(self):
 		raise NotImplementedError
 
-	def chart(self):
-		chart = Figure(tight_layout=True)
-		graph = chart.add_subplot(111)
-
+	def getData(self):
 		labels, data = self.getLineChartData()
+		x = numpy.asarray(labels, dtype=numpy.float64)
+		y = numpy.asarray(data, dtype=numpy.float64)
+		indices = lttb(x, y, MAX_LINE_POINTS)
+		return x[indices], y[indices]
+
+	def plot(self, figure, data):
+		graph = figure.add_subplot(111)
+		x, y = data
 		graph.set_xlabel(self.xlabel)
 		graph.set_ylabel(self.ylabel)
-		graph.set_xticks(labels)
-		graph.plot(data)
-
-		return FigureCanvas(chart)
+		graph.xaxis.set_major_locator(MaxNLocator(_max_ticks(figure), integer=True))
+		graph.plot(x, y)
+		return graph
+
+class ProfileChart(LineChart):
+
+	# y against x for every point of one track. Only the range shown is
+	# decimated, from the full arrays, so zooming in brings the detail back.
+	# onHover(point index or None) is called as the pointer moves over it
+
+	def __init__(self, x, y, title, xlabel, ylabel):
+		x = numpy.asarray(x, dtype=numpy.float64)
+		y = numpy.asarray(y, dtype=numpy.float64)
+		# index into x and y of each plotted point, in ascending x
+		indices = numpy.flatnonzero(~(numpy.isnan(x) | numpy.isnan(y)))
+		if numpy.any(numpy.diff(x[indices]) < 0):
+			indices = indices[numpy.argsort(x[indices], kind='stable')]
+		self.indices = indices
+		self.x = x[indices]
+		self.y = y[indices]
+		self.title = title
+		self.xlabel = xlabel
+		self.ylabel = ylabel
+		self.xrange = None
+		self.onHover = None
+
+	def cacheKey(self):
+		return (self.__class__, self.cacheToken(), self.xrange)
+
+	def getData(self):
+		# only slices, decimating is left to plot on the render thread
+		if self.xrange is None:
+			return self.x, self.y
+		start = numpy.searchsorted(self.x, self.xrange[0])
+		end = numpy.searchsorted(self.x, self.xrange[1], side='right')
+		return self.x[start:end], self.y[start:end]
+
+	def plot(self, figure, data):
+		graph = figure.add_subplot(111)
+		graph.grid(linestyle=':')
+		graph.set_xlabel(self.xlabel)
+		graph.set_ylabel(self.ylabel)
+		x, y = data
+		if len(x):
+			indices = lttb(x, y, MAX_LINE_POINTS)
+			graph.plot(x[indices], y[indices])
+			graph.set_xlim(self.xrange or (x[0], x[-1]))
+		graph.xaxis.set_major_locator(MaxNLocator(_max_ticks(figure)))
+		return graph
+
+	def setRange(self, xrange):
+		# (from, to) in x, None for everything
+		self.xrange = tuple(sorted(xrange)) if xrange else None
+
+	def pointAt(self, value):
+		# the index of the point nearest to x = value, None without points
+		if not len(self.x):
+			return None
+		i = int(numpy.searchsorted(self.x, value))
+		if i == len(self.x) or (i > 0 and value - self.x[i - 1] < self.x[i] - value):
+			i -= 1
+		return int(self.indices[i])
 
-class WeekStats(StatBarChart):
+	def chart(self):
+		return _ProfileView(self, self.getData())
+
+class _ProfileView(_ChartView):
+
+	# dragging across the chart zooms into that range, a right click or
+	# double click zooms back out
+
+	def __init__(self, chart, data):
+		_ChartView.__init__(self, chart, data)
+		self.add_events(Gdk.EventMask.POINTER_MOTION_MASK | Gdk.EventMask.BUTTON_PRESS_MASK |
+				Gdk.EventMask.BUTTON_RELEASE_MASK | Gdk.EventMask.LEAVE_NOTIFY_MASK)
+		self._pointer = None
+		self._dragStart = None
+		self.connect('motion-notify-event', self.on_motion)
+		self.connect('leave-notify-event', self.on_leave)
+		self.connect('button-press-event', self.on_button_press)
+		self.connect('button-release-event', self.on_button_release)
+
+	def drawOverlay(self, cr, width, height):
+		if self._pointer is None:
+			return
+		if self._dragStart is not None:
+			cr.set_source_rgba(0.2, 0.4, 1.0, 0.2)
+			cr.rectangle(min(self._dragStart, self._pointer), 0, abs(self._pointer - self._dragStart), height)
+			cr.fill()
+		cr.set_source_rgba(0.8, 0, 0, 0.8)
+		cr.set_line_width(1)
+		cr.move_to(self._pointer + 0.5, 0)
+		cr.line_to(self._pointer + 0.5, height)
+		cr.stroke()
+
+	def _hover(self, index):
+		if self._chart.onHover:
+			self._chart.onHover(index)
+
+	def on_motion(self, widget, event):
+		value = self.xValue(event.x)
+		self._pointer = event.x if value is not None or self._dragStart is not None else None
+		self._hover(None if value is None else self._chart.pointAt(value))
+		self.queue_draw()
+
+	def on_leave(self, widget, event):
+		if self._dragStart is None:
+			self._pointer = None
+			self._hover(None)
+			self.queue_draw()
+
+	def on_button_press(self, widget, event):
+		if event.button == 3 or event.type == Gdk.EventType._2BUTTON_PRESS:
+			self._dragStart = None
+			self._chart.setRange(None)
+			self.refresh()
+		elif event.button == 1 and self.xValue(event.x) is not None:
+			self._dragStart = event.x
+
+	def on_button_release(self, widget, event):
+		if event.button != 1 or self._dragStart is None:
+			return
+		start, self._dragStart = self._dragStart, None
+		if abs(event.x - start) < DRAG_THRESHOLD_PX:
+			self.queue_draw()
+			return
+		# a drag past the end of the axes zooms to that end
+		values = [self.xValue(start), self.xValue(event.x)]
+		if values[0] is None:
+			self.queue_draw()
+			return
+		if values[1] is None:
+			image, (left, right, xmin, xmax) = self._rendered
+			values[1] = xmax if event.x > start else xmin
+		self._chart.setRange(values)
+		self.refresh()
+
+class _TotalsChart(StatBarChart):
 
-	title = 'Total Distance Cycled Per Week'
-	xlabel = 'week'
 	ylabel = 'distance [km]'
 
-	def __init__(self):
-		self._weeks = [0]*53
+	def __init__(self, statistics):
+		self._statistics = statistics
+
+	def cacheKey(self):
+		return (self.__class__, _token(self._statistics), self._statistics.version)
 
-	def addTrace(self, trace):
-		week = trace.segments[0].points[0].time.isocalendar()[1]
-		distance = trace.get_moving_data().moving_distance
-		
-		self._weeks[week] += (distance/1000.0)
+	def getTotals(self):
+		raise NotImplementedError
+
+	def formatLabel(self, key):
+		raise NotImplementedError
 
 	def getBarChartData(self):
-		wk = 1
 		labels = []
 		data = []
-		for dist in self._weeks:
-			if dist:
-				data.append(dist)
-				labels.append('W%d' % wk)
-			wk += 1
+		for key, distance, moving_time, tracks in self.getTotals():
+			labels.append(self.formatLabel(key))
+			data.append(distance/1000.0)
 		return (labels, data)
 
+class WeekStats(_TotalsChart):
+
+	title = 'Total Distance Cycled Per Week'
+	xlabel = 'week'
+
+	def getTotals(self):
+		return self._statistics.weeks()
 
-def get_average_speed(track):
-	# 9.8.2011 Hadmut Danisch hadmut@danisch.de:
-	# duration can become 0 in special cases and thus cause division by zero
-	data = track.get_moving_data()
-	dis = data.moving_distance
-	dur = data.moving_time
-	if dur == 0:
-		return 0
-	return dis / dur
+	def formatLabel(self, key):
+		year, week = key
+		return '%d W%d' % (year, week)
+
+class MonthStats(_TotalsChart):
+
+	title = 'Total Distance Cycled Per Month'
+	xlabel = 'month'
+
+	def getTotals(self):
+		return self._statistics.months()
+
+	def formatLabel(self, key):
+		return '%d-%02d' % key
+
+class YearStats(_TotalsChart):
+
+	title = 'Total Distance Cycled Per Year'
+	xlabel = 'year'
+
+	def getTotals(self):
+		return self._statistics.years()
+
+	def formatLabel(self, key):
+		return '%d' % key
 
 
 class AvgSpeedStats(LineChart):
@@ -120,13 +448,13 @@ class AvgSpeedStats(LineChart):
 	xlabel = 'track'
 	ylabel = 'avg [m/s]'
 
-	def __init__(self):
-		self._avgspeeds = []
+	def __init__(self, statistics):
+		self._statistics = statistics
 
-	def addTrace(self, trace):
-		self._avgspeeds.append(get_average_speed(trace))
+	def cacheKey(self):
+		return (self.__class__, _token(self._statistics), self._statistics.version)
 
 	def getLineChartData(self):
-		return (range(len(self._avgspeeds)), self._avgspeeds)
-
+		avgspeeds = self._statistics.average_speeds()
+		return (range(len(avgspeeds)), avgspeeds)
 
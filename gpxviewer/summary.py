@@ -0,0 +1,144 @@
+#
+#  summary.py - Per-track summary figures for GPX Viewer
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+from collections import namedtuple
+
+import numpy
+
+# same constants as gpxpy, so figures match what it used to report
+EARTH_RADIUS = 6378.137 * 1000
+# speeds at or below this are counted as stopped, in km/h
+STOPPED_SPEED_THRESHOLD = 1
+IGNORE_TOP_SPEED_PERCENTILES = 0.05
+
+# times are seconds since the epoch, center is (latitude, longitude) and
+# bounds is (min_latitude, min_longitude, max_latitude, max_longitude)
+TrackSummary = namedtuple('TrackSummary', [
+    'moving_time', 'moving_distance', 'max_speed',
+    'center', 'bounds', 'start_time', 'end_time'])
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (numpy.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = numpy.sin((lat2 - lat1) / 2) ** 2 + \
+        numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS * 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a))
+
+
+def segment_distances(segment):
+    # distance in metres between each point and the next, in 3d where both
+    # points have a (non zero) elevation
+    d = haversine(segment.lat[:-1], segment.lon[:-1], segment.lat[1:], segment.lon[1:])
+    ele = segment.ele
+    has_ele = (ele[:-1] != 0) & (ele[1:] != 0) & ~numpy.isnan(ele[:-1]) & ~numpy.isnan(ele[1:])
+    if has_ele.any():
+        climb = numpy.where(has_ele, ele[1:] - ele[:-1], 0.)
+        d = numpy.hypot(d, climb)
+    return d
+
+
+def max_speed(speeds, distances):
+    # ignore jumps much longer than usual and the top 5% of what is left,
+    # both are usually GPS errors
+    if len(speeds) < 2:
+        return None
+
+    keep = numpy.abs(distances - distances.mean()) <= distances.std() * 1.5
+    speeds = numpy.sort(speeds[keep])
+    if not len(speeds):
+        return None
+
+    index = int(len(speeds) * (1 - IGNORE_TOP_SPEED_PERCENTILES))
+    if index >= len(speeds):
+        index = -1
+    return float(speeds[index])
+
+
+def summarize(track):
+    return summarize_segments(track.segments)
+
+
+def summarize_segments(segments):
+    moving_time = 0.
+    moving_distance = 0.
+    top_speed = 0.
+
+    segments = [s for s in segments if len(s)]
+    if not segments:
+        return TrackSummary(0., 0., 0., None, None, None, None)
+
+    for segment in segments:
+        d = segment_distances(segment)
+        seconds = numpy.diff(segment.time)
+        # pairs without both times compare false here and are skipped
+        timed = (seconds > 0) & (d > 0)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            speed = numpy.where(timed, d / seconds, 0.)
+        moving = timed & (speed * 3.6 > STOPPED_SPEED_THRESHOLD)
+
+        moving_seconds = numpy.where(moving, seconds, 0.)
+        moving_time += moving_seconds.sum()
+        moving_distance += d[moving].sum()
+
+        # like gpxpy, leading stopped points don't count towards max speed
+        counted = timed & (numpy.cumsum(moving_seconds) > 0)
+        seg_max_speed = max_speed(speed[counted], d[counted])
+        if seg_max_speed is not None and seg_max_speed > top_speed:
+            top_speed = seg_max_speed
+
+    lat = numpy.concatenate([s.lat for s in segments])
+    lon = numpy.concatenate([s.lon for s in segments])
+    time = numpy.concatenate([s.time for s in segments])
+    time = time[~numpy.isnan(time)]
+
+    return TrackSummary(
+        moving_time=float(moving_time),
+        moving_distance=float(moving_distance),
+        max_speed=top_speed,
+        center=(float(lat.mean()), float(lon.mean())),
+        bounds=(float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max())),
+        start_time=float(time[0]) if len(time) else None,
+        end_time=float(time[-1]) if len(time) else None)
+
+
+def extend_summary(summary, points, tail, new):
+    # the summary of a track of points points after new points were added
+    # at the end of the segment tail, which starts with the point before
+    # them if they continue a segment. Only the new legs are looked at for
+    # the maximum speed, so it can come out a little higher than with
+    # summarize over the whole track
+    if not new:
+        return summary
+    s = summarize_segments([tail])
+    if not points or summary.center is None:
+        return s
+    lat, lon = tail.lat[-new:], tail.lon[-new:]
+    total = points + new
+    return TrackSummary(
+        moving_time=summary.moving_time + s.moving_time,
+        moving_distance=summary.moving_distance + s.moving_distance,
+        max_speed=max(summary.max_speed, s.max_speed),
+        center=((summary.center[0] * points + float(lat.sum())) / total,
+                (summary.center[1] * points + float(lon.sum())) / total),
+        bounds=(min(summary.bounds[0], s.bounds[0]), min(summary.bounds[1], s.bounds[1]),
+                max(summary.bounds[2], s.bounds[2]), max(summary.bounds[3], s.bounds[3])),
+        start_time=summary.start_time if summary.start_time is not None else s.start_time,
+        end_time=s.end_time if s.end_time is not None else summary.end_time)
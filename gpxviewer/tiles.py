@@ -0,0 +1,203 @@
+#
+#  tiles.py - Downloading map tiles ahead of time and capping their cache
+#
+#  Copyright (C) 2009 Andrew Gee
+#
+#  GPX Viewer is free software: you can redistribute it and/or modify it
+#  under the terms of the GNU General Public License as published by the
+#  Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  GPX Viewer is distributed in the hope that it will be useful, but
+#  WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#  See the GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License along
+#  with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#
+#  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
+#
+#  Tiles are stored the way OsmGpsMap stores them when given a tile_cache
+#  directory, as <z>/<x>/<y>.<format>, so the map finds what was seeded.
+#  URLs use the OsmGpsMap repo-uri placeholders #X, #Y and #Z.
+#
+#  Needs neither GTK nor a display, so nothing here may import gi.
+#
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from . import simplify
+
+DEFAULT_URL = 'https://tile.openstreetmap.org/#Z/#X/#Y.png'
+URL_VARIABLE = 'GPXVIEWER_TILE_URL'
+DEFAULT_MAX_SIZE_MB = 1024
+MAX_SIZE_VARIABLE = 'GPXVIEWER_TILE_CACHE_MB'
+
+# tile servers ask for few connections per client; OpenStreetMap's policy
+# allows two and forbids seeding large areas, hence MAX_TILES
+DEFAULT_CONNECTIONS = 2
+MAX_TILES = 10000
+USER_AGENT = 'gpxviewer (https://github.com/andrewgee/gpxviewer)'
+TIMEOUT = 30
+
+
+def url_from_environment():
+    return os.environ.get(URL_VARIABLE) or DEFAULT_URL
+
+
+def max_size_from_environment():
+    try:
+        return int(float(os.environ[MAX_SIZE_VARIABLE]) * 2 ** 20)
+    except (KeyError, ValueError):
+        return DEFAULT_MAX_SIZE_MB * 2 ** 20
+
+
+def image_format(url):
+    ext = os.path.splitext(url.rpartition('/')[2])[1].lstrip('.').lower()
+    return ext if ext in ('png', 'jpg', 'jpeg') else 'png'
+
+
+def tile_url(url, z, x, y):
+    return url.replace('#Z', str(z)).replace('#X', str(x)).replace('#Y', str(y))
+
+
+def _segment_tiles(lat, lon, zoom):
+    # the tiles a polyline passes through at zoom, as (x, y) arrays
+    n = 2 ** zoom
+    px, py = simplify.project(lat, lon)
+    tx = px * n / simplify.TILE_SIZE
+    ty = py * n / simplify.TILE_SIZE
+    # enough samples along every leg that none skips a tile
+    tx, ty = simplify.densify(tx, ty, 0.5)
+    x = numpy.clip(tx.astype(numpy.int64), 0, n - 1)
+    y = numpy.clip(ty.astype(numpy.int64), 0, n - 1)
+    return x, y
+
+
+def corridor_tiles(tracks, min_zoom, max_zoom, margin=1, limit=MAX_TILES):
+    # {(z, x, y)} covering the tracks, widened by margin tiles on each side;
+    # stops early once there are more than limit
+    tiles = set()
+    for zoom in range(min_zoom, max_zoom + 1):
+        if limit is not None and len(tiles) > limit:
+            break
+        n = 2 ** zoom
+        lvl = simplify.level(zoom)
+        for track in tracks:
+            for segment in track.segments:
+                if not len(segment):
+                    continue
+                indices = simplify.level_indices(segment.rank, lvl)
+                lat, lon = (segment.lat, segment.lon) if indices is None else \
+                    (segment.lat[indices], segment.lon[indices])
+                x, y = _segment_tiles(lat, lon, zoom)
+                cells = numpy.unique(x * n + y)
+                for dx in range(-margin, margin + 1):
+                    for dy in range(-margin, margin + 1):
+                        cx = cells // n + dx
+                        cy = cells % n + dy
+                        ok = (cx >= 0) & (cx < n) & (cy >= 0) & (cy < n)
+                        tiles.update(zip([zoom] * int(ok.sum()), cx[ok].tolist(), cy[ok].tolist()))
+    return tiles
+
+
+class TileCache:
+    def __init__(self, directory, max_size=None, fmt='png'):
+        self.directory = directory
+        self.max_size = max_size if max_size is not None else max_size_from_environment()
+        self.format = fmt
+
+    def path(self, z, x, y):
+        return os.path.join(self.directory, str(z), str(x), '%d.%s' % (y, self.format))
+
+    def has(self, z, x, y):
+        return os.path.exists(self.path(z, x, y))
+
+    def put(self, z, x, y, data):
+        path = self.path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                # OsmGpsMap doesn't mark the tiles it reads, so the access
+                # time stands in for use; with relatime it is up to a day old
+                yield max(st.st_atime_ns, st.st_mtime_ns), st.st_size, path
+
+    def trim(self):
+        # evict least recently used tiles until the cache fits max_size
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            try:
+                os.removedirs(os.path.dirname(path))
+            except OSError:
+                pass
+
+
+class TileSeeder:
+    # Downloads the tiles missing from a TileCache over at most
+    # connections connections. seed() blocks, so the UI runs it on a thread,
+    # and calls progress(done, total) on that thread.
+
+    def __init__(self, cache, url=None, connections=DEFAULT_CONNECTIONS):
+        self.cache = cache
+        self.url = url or url_from_environment()
+        self.connections = connections
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _fetch(self, tile):
+        if self._cancelled.is_set():
+            return None
+        request = urllib.request.Request(tile_url(self.url, *tile), headers={'User-Agent': USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+                data = response.read()
+            self.cache.put(*tile, data)
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def seed(self, tiles, progress=None):
+        # returns (downloaded, failed); tiles already cached are skipped
+        self._cancelled.clear()
+        missing = sorted(t for t in tiles if not self.cache.has(*t))
+        downloaded = failed = 0
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            for done, ok in enumerate(executor.map(self._fetch, missing), 1):
+                if ok:
+                    downloaded += 1
+                elif ok is False:
+                    failed += 1
+                if progress:
+                    progress(done, len(missing))
+        return downloaded, failed
+
@@ -20,6 +20,10 @@
 #  If you're having any problems, don't hesitate to contact: andrew@andrewgee.org
 #
 import os
+import functools
+import threading
+import contextlib
+from datetime import datetime
 
 import gi
 
@@ -33,10 +37,23 @@ from gi.repository import GObject
 
 from gi.repository import OsmGpsMap
 
-from . import stats
+from .aggregates import TrackStatistics, get_average_speed
+from .loader import GPXLoader
+from .memory import TrackMemory
+from .drawing import TrackDrawing
+from .layers import HeatmapLayer, MarkerLayer
+from .heatmap import HeatmapGrids
+from .series import TrackPointIndex
+from .dedup import LoadedTracks
+from .follow import start_following, can_follow
+from .reader import Track, GPXReadError
+from . import spatial
+from . import simplify
+from . import profiling
+from . import tiles
+from . import archive
+from . import coloring
 
-from gpxpy import parse
-from gpxpy.gpx import GPXException
 from colorsys import hsv_to_rgb
 
 import locale
@@ -58,9 +75,20 @@ def show_url(url):
     Gtk.show_uri(None, url, Gdk.CURRENT_TIME)
 
 
+# tracks added to the heatmap per main loop iteration
+HEATMAP_BATCH = 20
+# adding or removing more rows than this at once is done with the sidebar
+# detached from the model, see bulk_update
+BULK_ROWS = 100
 ALPHA_UNSELECTED = 0.5
 ALPHA_SELECTED = 0.8
-LAZY_LOAD_AFTER_N_FILES = 3
+# tracks this far outside the visible map, as a fraction of its size, stay
+# drawn so that short pans don't have to rebuild them
+VIEWPORT_MARGIN = 0.5
+# how close, in pixels, a click has to be to a track to select it
+CLICK_TOLERANCE_PX = 8
+# how often a followed file is checked for new points
+FOLLOW_INTERVAL_S = 2
 
 
 class MainWindow:
@@ -68,29 +96,20 @@ class MainWindow:
     GPX_IDX = 1
     OSM_IDX = 2
 
-    def get_other_tracks(self, trace):
-        tracks = []
-        for row in self.model:
-            for track in row.iterchildren():
-                if trace != track[self.GPX_IDX]:
-                    tracks += track[self.OSM_IDX]
-        return tracks
+    def get_all_drawings(self):
+        return [t[self.OSM_IDX] for f in self.model for t in f.iterchildren()]
 
     def add_track(self, parent, track, color):
-        gpstracks = []
-        for segment in track.segments:
-
-            gpstrack = OsmGpsMap.MapTrack()
-            gpstrack.set_color(color)
-            gpstrack.props.alpha = 0.8
-
-            for point in segment.points:
-                gpstrack.add_point(OsmGpsMap.MapPoint.new_degrees(point.latitude, point.longitude))
-
-            gpstracks.append(gpstrack)
-            self.map.track_add(gpstrack)
-
-        self.model.append(parent, [track.name, track, gpstracks])
+        drawing = TrackDrawing(self.map, track, color, self.unselectedAlpha, self.trackMemory,
+                               self.coloring, self.palette)
+        with profiling.span('TreeStore.append'):
+            _iter = self.model.append(parent, [track.name, track, drawing])
+        drawing.row = Gtk.TreeRowReference.new(self.model, self.model.get_path(_iter))
+        self.trackIndex.insert(drawing, spatial.segment_boxes(track))
+        self.statistics.add(track)
+        if self.heatmap is not None:
+            self.queue_heatmap_add([track])
+        self.queue_viewport_update()
 
     def get_all_traces(self):
         return [t[self.GPX_IDX] for f in self.model for t in f.iterchildren()]
@@ -102,20 +121,57 @@ class MainWindow:
         self.wTree.set_translation_domain('gpxviewer')
         self.wTree.add_from_file("%sgpxviewer.ui" % ui_dir)
 
-        # track_name, gpx, [OsmGpsMapTrack]
+        # track_name, reader.Track, TrackDrawing
         self.model = Gtk.TreeStore(str, object, object)
+        # segment bounding boxes of every TrackDrawing, and those on the map
+        self.trackIndex = spatial.BoxIndex()
+        self.visibleDrawings = set()
+        self.viewportUpdateId = None
+        # the highlighted TrackDrawings, every other one is drawn with
+        # unselectedAlpha, which stays ALPHA_SELECTED until the first selection
+        self.selectedDrawings = set()
+        self.unselectedAlpha = ALPHA_SELECTED
+        self.selectionUpdateId = None
+        # in heatmap mode, only the selected track is drawn as a line
+        self.heatmap = None
+        self.heatmapLayer = None
+        self.heatmapPending = {}
+        self.heatmapUpdateId = None
+        # dot on the map at the point under the pointer in an inspector
+        self.markerLayer = None
+        # the selected track's points near the pointer, built on first hover
+        self.pointIndex = None
+        # what the tracks are colored by, see TrackDrawing.set_coloring
+        self.coloring = None
+        self.palette = coloring.Palette([Gdk.RGBA(*rgb) for rgb in coloring.PALETTE.colors],
+                                        Gdk.RGBA(*coloring.PALETTE.missing))
+        # running totals behind the statistics window
+        self.statistics = TrackStatistics()
+        # the file followed as it is recorded, see follow_toggled, and
+        # the indices of the tracks met in it so far
+        self.follower = None
+        self.followRow = None
+        self.followId = None
+        self.followSeen = set()
+        # the chunks of the first poll, done in a worker, see start_following
+        self.followChunks = None
 
         signals = {
             "on_windowMain_destroy": self.quit,
             "on_menuitemQuit_activate": self.quit,
             "on_menuitemOpen_activate": self.open_gpx,
+            "on_menuitemLibrary_activate": self.show_library,
             "on_menuitemZoomIn_activate": self.zoom_map_in,
             "on_buttonZoomIn_clicked": self.zoom_map_in,
             "on_menuitemZoomOut_activate": self.zoom_map_out,
             "on_buttonZoomOut_clicked": self.zoom_map_out,
             "on_menuitemAbout_activate": self.open_about_dialog,
             "on_checkmenuitemShowSidebar_toggled": self.show_sidebar_toggled,
+            "on_checkmenuitemHeatmap_toggled": self.heatmap_toggled,
+            "on_checkmenuitemFollow_toggled": self.follow_toggled,
             "on_menuitemShowStatistics_activate": self.show_statistics,
+            "on_menuitemProfile_activate": self.show_profile,
+            "on_menuitemSeedTiles_activate": self.seed_tiles,
             "on_buttonTrackAdd_clicked": self.button_track_add_clicked,
             "on_buttonTrackDelete_clicked": self.button_track_delete_clicked,
             "on_buttonTrackProperties_clicked": self.button_track_properties_clicked,
@@ -130,13 +186,22 @@ class MainWindow:
         i.connect("toggled", self.auto_center_toggled)
         self.autoCenter = i.get_active()
 
+        for name, mode in (("radiomenuitemColorTrack", None),
+                           ("radiomenuitemColorSpeed", coloring.SPEED),
+                           ("radiomenuitemColorGradient", coloring.GRADIENT)):
+            self.wTree.get_object(name).connect("toggled", self.coloring_toggled, mode)
+
         self.ui_dir = ui_dir
 
-        self.map = OsmGpsMap.Map(
-            tile_cache=os.path.join(
-                GLib.get_user_cache_dir(),
-                'gpxviewer', 'tiles'))
+        tile_url = tiles.url_from_environment()
+        self.tileCache = tiles.TileCache(os.path.join(GLib.get_user_cache_dir(), 'gpxviewer', 'tiles'),
+                                         fmt=tiles.image_format(tile_url))
+        self.tileSeeder = None
+        self.map = OsmGpsMap.Map(tile_cache=self.tileCache.directory)
         self.map.set_property("map-source", OsmGpsMap.MapSource_t.OPENSTREETMAP)
+        if tile_url != tiles.DEFAULT_URL:
+            self.map.set_property("repo-uri", tile_url)
+            self.map.set_property("image-format", self.tileCache.format)
         self.map.layer_add(
             OsmGpsMap.MapOsd(
                 show_dpad=False,
@@ -144,8 +209,23 @@ class MainWindow:
                 show_scale=True,
                 show_coordinates=False))
         self.wTree.get_object("hbox_map").pack_start(self.map, True, True, 0)
+        self.map.connect("notify::zoom", self.on_map_zoom_changed)
+        self.map.connect("changed", lambda *a: self.queue_viewport_update())
+        self.map.connect("size-allocate", lambda *a: self.queue_viewport_update())
+        self.map.connect("button-press-event", self.on_map_button_press)
+        self.map.connect("button-release-event", self.on_map_button_release)
+        self.map.add_events(Gdk.EventMask.POINTER_MOTION_MASK | Gdk.EventMask.LEAVE_NOTIFY_MASK)
+        self.map.connect("motion-notify-event", self.on_map_motion)
+        self.map.connect("leave-notify-event", lambda *a: self.show_point(None))
+        self.mapPressPosition = None
 
         sb = self.wTree.get_object("statusbar1")
+        self.statusbar = sb
+        self.statusbarLoadingContext = sb.get_context_id("loading")
+        self.statusbarTilesContext = sb.get_context_id("tiles")
+        self.statusbarDuplicatesContext = sb.get_context_id("duplicates")
+        self.statusbarFollowContext = sb.get_context_id("follow")
+        self.statusbarPointContext = sb.get_context_id("point")
         # move zoom control into apple like slider
         self.zoomSlider = MapZoomSlider(self.map)
         self.zoomSlider.show_all()
@@ -169,6 +249,36 @@ class MainWindow:
         except AttributeError:
             self.spinner = None
 
+        # point data held for the loaded tracks, against the budget
+        self.memoryLabel = Gtk.Label()
+        sb.pack_end(self.memoryLabel, False, False, 0)
+
+        # cancel button shown while files are loading in the background
+        self.buttonCancelLoad = Gtk.Button.new_from_icon_name("process-stop", Gtk.IconSize.MENU)
+        self.buttonCancelLoad.set_relief(Gtk.ReliefStyle.NONE)
+        self.buttonCancelLoad.set_tooltip_text(_("Cancel loading"))
+        self.buttonCancelLoad.connect("clicked", self.cancel_loading)
+        sb.pack_end(self.buttonCancelLoad, False, False, 0)
+
+        cache_dir = os.path.join(GLib.get_user_cache_dir(), 'gpxviewer', 'tracks')
+        self.loader = GPXLoader(self.on_gpx_loaded, self.on_loading_progress, cache_dir=cache_dir,
+                                check=self.check_duplicate_file)
+        # files and tracks already loaded, so copies aren't parsed and
+        # drawn, or counted in the statistics, again
+        self.loadedTracks = LoadedTracks()
+        self.duplicateFiles = 0
+        self.duplicateTracks = 0
+        self.trackMemory = TrackMemory(self.loader.reload, self.on_tracks_restored)
+        # the drawing to inspect once its evicted points are back
+        self.inspectPending = None
+        self.recentPending = set()
+        # rows of the files waiting to be loaded, and where those the
+        # library knows about are
+        self.pendingFiles = {}
+        self.pendingBounds = {}
+        self.libraryWindow = None
+        self.profileWindow = None
+
         self.wTree.connect_signals(signals)
 
         # add open with external tool submenu items and actions
@@ -177,7 +287,7 @@ class MainWindow:
             'merkaartor': N_('Merkaartor'),
             'gpsprune': N_('GPSprune'),
             'viking': N_('Viking'),
-            'gpsmaster': N_('GPS-Master)'
+            'gpsmaster': N_('GPS-Master')
         }
         submenu_open_with = Gtk.Menu()
         for prog, progname in programs.items():
@@ -196,54 +306,146 @@ class MainWindow:
             "https://bugs.launchpad.net/gpxviewer/+filebug"))
 
         self.tv = Gtk.TreeView(self.model)
-        self.tv.get_selection().connect("changed", self.on_selection_changed)
-        self.tv.append_column(
-            Gtk.TreeViewColumn(
-                "Track Name",
-                Gtk.CellRendererText(),
-                text=self.NAME_IDX
-            )
+        self.selectionChangedId = self.tv.get_selection().connect("changed", self.on_selection_changed)
+        renderer = Gtk.CellRendererText()
+        column = Gtk.TreeViewColumn(
+            "Track Name",
+            renderer,
+            text=self.NAME_IDX
         )
+        column.set_cell_data_func(renderer, self.format_name_cell)
+        self.tv.append_column(column)
         self.wTree.get_object("scrolledwindow1").add(self.tv)
         self.sb = self.wTree.get_object("vbox_sidebar")
 
         self.hide_spinner()
         self.hide_track_selector()
 
-        self.lazyLoadFiles(files)
+        self.buttonCancelLoad.hide()
+        # only there when started with --profile
+        self.wTree.get_object("menuitemProfile").set_visible(profiling.enabled)
 
         self.map.show()
         self.mainWindow.show()
 
-    def lazyLoadFiles(self, files):
-        def do_lazy_load(_files):
-            try:
-                self.load_gpx(_files.pop())
-                self.loadingFiles -= 1
-                return True
-            except IndexError:
-                self.loadingFiles = 0
-                return False
-
-        self.loadingFiles = 0
-        if not files:
+        # idle sources run after the first frame has been drawn
+        if files:
+            GLib.idle_add(self.load_files, files)
+        # walking the tile cache takes a while once it is big
+        threading.Thread(target=self.tileCache.trim, daemon=True).start()
+
+    def load_files(self, files, bounds=None):
+        # Every file gets a row straight away, greyed out until it is
+        # loaded; selecting it loads it sooner, deleting it cancels it.
+        # With bounds, {filename: (min lat, min lon, max lat, max lon)},
+        # files on the map are loaded first. The members of zip and tar
+        # archives are loaded as files of their own, in parallel
+        filenames = [f for f in dict.fromkeys(archive.expand(files)) if f not in self.pendingFiles]
+        with self.bulk_update(len(filenames)):
+            for filename in filenames:
+                _iter = self.model.append(None, [filename, None, None])
+                self.pendingFiles[filename] = Gtk.TreeRowReference.new(self.model, self.model.get_path(_iter))
+        if bounds:
+            self.pendingBounds.update((f, bounds[f]) for f in filenames if f in bounds)
+        self.loader.load(filenames)
+        self.prioritize_viewport()
+        return False
+
+    @contextlib.contextmanager
+    def bulk_update(self, rows):
+        # Inserting or removing rows with the tree view attached updates
+        # the view for every row. For many rows, the view is detached
+        # meanwhile, and its selection and expanded rows restored after
+        if rows < BULK_ROWS:
+            yield
             return
+        expanded = []
+        self.tv.map_expanded_rows(
+            lambda tv, path, data: expanded.append(Gtk.TreeRowReference.new(self.model, path)), None)
+        model, _iter = self.tv.get_selection().get_selected()
+        selected = Gtk.TreeRowReference.new(self.model, self.model.get_path(_iter)) if _iter else None
+        selection = self.tv.get_selection()
+        selection.handler_block(self.selectionChangedId)
+        self.tv.set_model(None)
+        try:
+            with profiling.span('bulk_update', rows=rows):
+                yield
+        finally:
+            self.tv.set_model(self.model)
+            for row in expanded:
+                if row.valid():
+                    self.tv.expand_row(row.get_path(), False)
+            if selected is not None and selected.valid():
+                selection.select_path(selected.get_path())
+            selection.handler_unblock(self.selectionChangedId)
+            # the selected row may be gone
+            self.queue_selection_update()
+
+    def drop_pending(self, filename):
+        # forgets that filename is waiting and returns its row, if it still has one
+        self.pendingBounds.pop(filename, None)
+        row = self.pendingFiles.pop(filename, None)
+        if row is not None and row.valid():
+            return self.model.get_iter(row.get_path())
+        return None
 
-        # if less than LAZY_LOAD_AFTER_N_FILES load directly, else
-        # load on idle
-        if len(files) < LAZY_LOAD_AFTER_N_FILES:
-            i = 0
-            for filename in files:
-                self.loadingFiles = i
-                self.load_gpx(filename)
-                if i < LAZY_LOAD_AFTER_N_FILES:
-                    i += 1
-                else:
-                    self.loadingFiles = 0
-                    break
+    def is_pending_row(self, _iter):
+        row = self.pendingFiles.get(self.model.get_value(_iter, self.NAME_IDX))
+        return row is not None and row.valid() and row.get_path() == self.model.get_path(_iter)
+
+    def format_name_cell(self, column, cell, model, _iter, data):
+        cell.set_property("sensitive", model.iter_parent(_iter) is not None or not self.is_pending_row(_iter))
+
+    def prioritize_viewport(self):
+        if not self.pendingBounds:
+            return
+        min_lat, min_lon, max_lat, max_lon = self.get_viewport()
+        self.loader.prioritize([f for f, (lat1, lon1, lat2, lon2) in self.pendingBounds.items()
+                                if lat1 <= max_lat and lat2 >= min_lat and lon1 <= max_lon and lon2 >= min_lon])
+
+    def check_duplicate_file(self, filename, digest):
+        if self.loadedTracks.claim_file(filename, digest) is None:
+            return True
+        self.duplicateFiles += 1
+        self.update_duplicates_message()
+        self.recentPending.discard(filename)
+        _iter = self.drop_pending(filename)
+        if _iter is not None:
+            self.model.remove(_iter)
+        return False
+
+    def update_duplicates_message(self):
+        self.statusbar.remove_all(self.statusbarDuplicatesContext)
+        if self.duplicateFiles or self.duplicateTracks:
+            self.statusbar.push(self.statusbarDuplicatesContext,
+                                _("Skipped %(files)d files and %(tracks)d tracks already loaded") % {
+                                    "files": self.duplicateFiles, "tracks": self.duplicateTracks})
+
+    def on_loading_progress(self, done, total):
+        self.statusbar.remove_all(self.statusbarLoadingContext)
+        if total and not done:
+            # counted afresh for every load
+            self.duplicateFiles = self.duplicateTracks = 0
+            self.update_duplicates_message()
+        if total:
+            self.statusbar.push(self.statusbarLoadingContext,
+                                _("Loading %(done)d of %(total)d files...") % {"done": done, "total": total})
+            self.buttonCancelLoad.show()
         else:
-            self.loadingFiles = len(files)
-            GObject.timeout_add(100, do_lazy_load, files)
+            self.buttonCancelLoad.hide()
+
+    def cancel_loading(self, *args):
+        self.loader.cancel()
+        self.recentPending.clear()
+        with self.bulk_update(len(self.pendingFiles)):
+            for filename in list(self.pendingFiles):
+                # it may have been hashed already, but nothing of it is shown
+                self.loadedTracks.release_file(filename)
+                _iter = self.drop_pending(filename)
+                if _iter is not None:
+                    self.model.remove(_iter)
+        if self.tileSeeder:
+            self.tileSeeder.cancel()
 
     def show_spinner(self):
         if self.spinner:
@@ -272,15 +474,186 @@ class MainWindow:
         model, _iter = selection.get_selected()
         if not _iter:
             return
+        if self.is_pending_row(_iter):
+            self.loader.prioritize([self.model.get_value(_iter, self.NAME_IDX)])
+
+        with profiling.span('select_trace'):
+            self.select_trace(self.model[_iter])
+        self.queue_selection_update()
+
+    def queue_selection_update(self):
+        # holding down an arrow key in the sidebar changes the selection
+        # many times a frame, the map only needs to show the last one
+        if self.selectionUpdateId is None:
+            self.selectionUpdateId = GLib.idle_add(self.update_selection)
+
+    def update_selection(self):
+        self.selectionUpdateId = None
+        model, _iter = self.tv.get_selection().get_selected()
+        drawing = self.model.get_value(_iter, self.OSM_IDX) if _iter else None
+        selected = {drawing} if drawing else set()
+
+        with profiling.span('update_selection'):
+            if self.unselectedAlpha != ALPHA_UNSELECTED:
+                # the first selection dims every other track, once
+                self.unselectedAlpha = ALPHA_UNSELECTED
+                self.selectedDrawings = set(self.get_all_drawings())
+            for d in self.selectedDrawings - selected:
+                d.set_alpha(self.unselectedAlpha)
+            for d in selected - self.selectedDrawings:
+                d.set_alpha(ALPHA_SELECTED)
+                self.trackMemory.need(d.track)
+            self.selectedDrawings = selected
+        if self.pointIndex is not None and (drawing is None or self.pointIndex.track is not drawing.track):
+            self.pointIndex = None
+            self.show_point(None)
+        if self.heatmap is not None:
+            self.queue_viewport_update()
+        self.trim_memory()
+        return False
+
+    def on_map_zoom_changed(self, map_, paramspec):
+        zoom = self.map.props.zoom
+        for drawing in self.visibleDrawings:
+            drawing.set_zoom(zoom)
+
+    def get_viewport(self, margin=0.0):
+        pt1, pt2 = self.map.get_bbox()
+        lat1, lon1 = pt1.get_degrees()
+        lat2, lon2 = pt2.get_degrees()
+        min_lat, max_lat = min(lat1, lat2), max(lat1, lat2)
+        min_lon, max_lon = min(lon1, lon2), max(lon1, lon2)
+        dlat = (max_lat - min_lat) * margin
+        dlon = (max_lon - min_lon) * margin
+        return min_lat - dlat, min_lon - dlon, max_lat + dlat, max_lon + dlon
+
+    def queue_viewport_update(self):
+        if self.viewportUpdateId is None:
+            self.viewportUpdateId = GLib.idle_add(self.update_viewport)
+
+    def update_viewport(self):
+        self.viewportUpdateId = None
+        with profiling.span('update_viewport') as span:
+            visible = self.trackIndex.intersecting(*self.get_viewport(VIEWPORT_MARGIN))
+            if self.heatmap is not None:
+                visible &= self.selectedDrawings
+            leaving = self.visibleDrawings - visible
+            # when none stay, such as after a jump across the map, one
+            # call takes every MapTrack off rather than one call each, each
+            # searching the map's list of them. Adding has no such call
+            removed = len(leaving) > 1 and not visible & self.visibleDrawings
+            if removed:
+                self.map.track_remove_all()
+            for drawing in leaving:
+                drawing.set_visible(False, removed)
+            for drawing in visible - self.visibleDrawings:
+                drawing.set_visible(True)
+            self.visibleDrawings = visible
+            span.set(tracks=len(visible))
+        self.trim_memory()
+        self.prioritize_viewport()
+        return False
+
+    def trim_memory(self):
+        # everything on the map, selected or being followed keeps its points
+        keep = self.visibleDrawings | self.selectedDrawings | set(self.followed_drawings().values())
+        self.trackMemory.trim({d.track for d in keep})
+        self.memoryLabel.set_text(_("%(used).0f of %(budget).0f MB") % {
+            "used": self.trackMemory.usage() / 2 ** 20, "budget": self.trackMemory.budget / 2 ** 20})
+
+    def on_tracks_restored(self, restored, lost):
+        for drawing in self.visibleDrawings:
+            if drawing.track in restored:
+                drawing.refresh()
+        pending = self.inspectPending
+        if pending is not None and pending.track in restored | lost:
+            self.inspectPending = None
+            if pending.track in restored:
+                self.inspect_track(pending)
+            else:
+                self.show_gpx_error()
+        self.trim_memory()
+
+    def on_map_button_press(self, map_, event):
+        if event.button == 1:
+            self.mapPressPosition = (event.x, event.y)
+        return False
+
+    def on_map_button_release(self, map_, event):
+        # a press and release in the same place is a click, anything else
+        # was a drag of the map
+        if event.button != 1 or self.mapPressPosition is None:
+            return False
+        px, py = self.mapPressPosition
+        self.mapPressPosition = None
+        if abs(event.x - px) > 3 or abs(event.y - py) > 3:
+            return False
+
+        drawing = self.find_drawing_at(event.x, event.y)
+        if drawing and drawing.row and drawing.row.valid():
+            path = drawing.row.get_path()
+            self.tv.expand_to_path(path)
+            self.tv.get_selection().select_path(path)
+            self.tv.scroll_to_cell(path, None, False, 0, 0)
+        self.show_point(self.find_point_at(event.x, event.y))
+        return False
 
-        trace = self.model.get_value(_iter, self.GPX_IDX)
-        tracks = self.model.get_value(_iter, self.OSM_IDX)
-        self.select_trace(self.model[_iter])
+    def on_map_motion(self, map_, event):
+        # not while the map is dragged
+        if not event.state & Gdk.ModifierType.BUTTON1_MASK:
+            self.show_point(self.find_point_at(event.x, event.y))
+        return False
 
-        # highlight current track
-        self.select_tracks(tracks, ALPHA_SELECTED)
-        # dim other tracks
-        self.select_tracks(self.get_other_tracks(trace), ALPHA_UNSELECTED)
+    def find_point_at(self, x, y):
+        # index in self.pointIndex.series of the selected track's point
+        # nearest to (x, y), if it is within CLICK_TOLERANCE_PX
+        model, _iter = self.tv.get_selection().get_selected()
+        drawing = self.model.get_value(_iter, self.OSM_IDX) if _iter else None
+        if drawing is None or not drawing.visible:
+            return None
+        if self.pointIndex is None or not self.pointIndex.is_current(drawing.track):
+            with profiling.span('TrackPointIndex', points=len(drawing.track)):
+                self.pointIndex = TrackPointIndex(drawing.track)
+        lat, lon = self.map.convert_screen_to_geographic(x, y).get_degrees()
+        return self.pointIndex.nearest(lat, lon, CLICK_TOLERANCE_PX / 2 ** self.map.props.zoom)
+
+    def show_point(self, index):
+        # the time, speed, elevation and distance from the start of point
+        # index of self.pointIndex in the statusbar, with a dot on the map
+        self.statusbar.remove_all(self.statusbarPointContext)
+        if index is None:
+            self.set_marker(None, None)
+            return
+        series = self.pointIndex.series
+        t, speed, ele = series.time[index], series.speed[index], series.ele[index]
+        self.statusbar.push(self.statusbarPointContext, _(
+            "%(time)s, %(speed)s m/s, %(elevation)s m, %(distance).2f km from the start") % {
+            "time": datetime.fromtimestamp(t).strftime("%x %X") if t == t else "--",
+            "speed": '%.2f' % speed if speed == speed else "--",
+            "elevation": '%.0f' % ele if ele == ele else "--",
+            "distance": series.distance[index] / 1000})
+        self.set_marker(series.lat[index], series.lon[index])
+
+    def find_drawing_at(self, x, y):
+        lat, lon = self.map.convert_screen_to_geographic(x, y).get_degrees()
+        scale = 2 ** self.map.props.zoom
+        cx, cy = simplify.project(lat, lon)
+        cx, cy = cx * scale, cy * scale
+
+        # a box around the click a few pixels wide, in degrees
+        lat2, lon2 = self.map.convert_screen_to_geographic(
+            x + CLICK_TOLERANCE_PX, y + CLICK_TOLERANCE_PX).get_degrees()
+        dlat, dlon = abs(lat2 - lat), abs(lon2 - lon)
+        candidates = self.trackIndex.intersecting(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+        best, best_distance = None, CLICK_TOLERANCE_PX
+        for drawing in candidates & self.visibleDrawings:
+            for segment in drawing.track.segments:
+                xs, ys = simplify.project(*drawing.segment_points(segment))
+                d = spatial.polyline_distance(cx, cy, xs * scale, ys * scale)
+                if d <= best_distance:
+                    best, best_distance = drawing, d
+        return best
 
     def update_tiles_queued(self, map_, paramspec):
         if self.map.props.tiles_queued > 0:
@@ -288,6 +661,50 @@ class MainWindow:
         else:
             self.hide_spinner()
 
+    def heatmap_toggled(self, item):
+        if item.get_active():
+            self.heatmap = HeatmapGrids()
+            self.heatmapLayer = HeatmapLayer(self.heatmap)
+            self.map.layer_add(self.heatmapLayer)
+            self.queue_heatmap_add([d.track for d in self.get_all_drawings()])
+        else:
+            self.map.layer_remove(self.heatmapLayer)
+            self.heatmap = self.heatmapLayer = None
+            self.heatmapPending.clear()
+            self.map.map_redraw_idle()
+        self.queue_viewport_update()
+
+    def queue_heatmap_add(self, tracks):
+        self.heatmapPending.update(dict.fromkeys(tracks))
+        if self.heatmapUpdateId is None:
+            self.heatmapUpdateId = GLib.idle_add(self.update_heatmap)
+
+    def update_heatmap(self):
+        # a few tracks at a time, so switching to the heatmap with thousands
+        # loaded doesn't freeze the window
+        if self.heatmap is None:
+            self.heatmapUpdateId = None
+            return False
+        with profiling.span('update_heatmap'):
+            for _ in range(min(HEATMAP_BATCH, len(self.heatmapPending))):
+                track = next(iter(self.heatmapPending))
+                del self.heatmapPending[track]
+                self.heatmap.add(track)
+        self.map.map_redraw_idle()
+        if self.heatmapPending:
+            return True
+        self.heatmapUpdateId = None
+        return False
+
+    def coloring_toggled(self, item, mode):
+        if not item.get_active():
+            return
+        self.coloring = mode
+        # the hidden ones are colored when they are shown again
+        with profiling.span('set_coloring', tracks=len(self.visibleDrawings)):
+            for drawing in self.get_all_drawings():
+                drawing.set_coloring(mode, self.palette)
+
     def show_sidebar_toggled(self, item):
         if item.get_active():
             self.show_track_selector()
@@ -295,14 +712,15 @@ class MainWindow:
             self.hide_track_selector()
 
     def show_statistics(self, item):
-        ws = stats.WeekStats()
-        ss = stats.AvgSpeedStats()
-        for t in self.get_all_traces():
-            ws.addTrace(t)
-            ss.addTrace(t)
+        # matplotlib is slow to import and most sessions never get here
+        from . import stats
 
         w = Gtk.Window()
-        w.add(stats.ChartNotebook(ws, ss))
+        w.add(stats.ChartNotebook(
+            stats.WeekStats(self.statistics),
+            stats.MonthStats(self.statistics),
+            stats.YearStats(self.statistics),
+            stats.AvgSpeedStats(self.statistics)))
         w.resize(500, 300)
         w.set_position(Gtk.WindowPosition.CENTER_ON_PARENT)
         w.set_transient_for(self.mainWindow)
@@ -314,12 +732,6 @@ class MainWindow:
         dialog.connect("response", lambda *a: dialog.hide())
         dialog.show_all()
 
-    def select_tracks(self, tracks, alpha):
-        if not tracks:
-            return
-        for t in tracks:
-            t.props.alpha = alpha
-
     def select_trace(self, row):
         if not row[self.GPX_IDX]:
             self.set_distance_label()
@@ -334,14 +746,22 @@ class MainWindow:
             return
 
         self.zoom = 12
-        distance = row[self.GPX_IDX].get_moving_data().moving_distance
-        maximum_speed = row[self.GPX_IDX].get_moving_data().max_speed
-        average_speed = stats.get_average_speed(row[self.GPX_IDX])
-        duration = row[self.GPX_IDX].get_moving_data().moving_time
-        clat = row[self.GPX_IDX].get_center().latitude
-        clon = row[self.GPX_IDX].get_center().longitude
-        gpxfrom = row[self.GPX_IDX].get_time_bounds().start_time
-        gpxto = row[self.GPX_IDX].get_time_bounds().end_time
+        summary = row[self.GPX_IDX].summary
+        self.show_summary(summary)
+
+        self.currentFilename = row.get_parent()[self.NAME_IDX]
+        self.mainWindow.set_title(_("GPX Viewer - %s") % row[self.GPX_IDX].name)
+
+        if self.autoCenter and summary.center:
+            self.set_centre(*summary.center)
+
+    def show_summary(self, summary):
+        distance = summary.moving_distance
+        maximum_speed = summary.max_speed
+        average_speed = get_average_speed(summary)
+        duration = summary.moving_time
+        gpxfrom = datetime.fromtimestamp(summary.start_time) if summary.start_time is not None else None
+        gpxto = datetime.fromtimestamp(summary.end_time) if summary.end_time is not None else None
 
         self.set_distance_label(round(distance / 1000, 2))
         self.set_maximum_speed_label(maximum_speed)
@@ -356,29 +776,61 @@ class MainWindow:
             if gpxto:
                 self.set_logging_time_label(gpxfrom.strftime("%X"), gpxto.strftime("%X"))
 
-        self.currentFilename = row.get_parent()[self.NAME_IDX]
-        self.mainWindow.set_title(_("GPX Viewer - %s") % row[self.GPX_IDX].name)
-
-        if self.autoCenter:
-            self.set_centre(clat, clon)
-
     def load_gpx(self, filename):
-        try:
-            tracks = parse(open(filename)).tracks
-        except GPXException:
+        self.load_files([filename])
+
+    def on_gpx_loaded(self, batch):
+        with self.bulk_update(sum(len(tracks) + 1 for _, tracks in batch if tracks)):
+            invalid = self.add_loaded(batch)
+        if invalid:
             self.show_gpx_error()
-            return None
 
-        parent = self.model.append(None, [filename, None, None])
-        for i, track in enumerate(tracks):
-            color = Gdk.RGBA(*hsv_to_rgb((i / len(tracks) + 1 / 3) % 1.0, 1.0, 1.0))
-            self.add_track(parent, track, color)
+    def add_loaded(self, batch):
+        # returns whether some of the files couldn't be read
+        invalid = False
+        for filename, tracks in batch:
+            # the members of an archive are recent as the archive
+            source = archive.split(filename)[0]
+            if tracks is None:
+                invalid = True
+                self.loadedTracks.release_file(filename)
+                _iter = self.drop_pending(filename)
+                if _iter is not None:
+                    self.model.remove(_iter)
+                # other members of the archive may still load
+                if source == filename:
+                    self.recentPending.discard(source)
+                continue
+            self.add_gpx(filename, tracks)
+            if source in self.recentPending:
+                self.recentPending.discard(source)
+                self.recent.add_item("file://" + source)
+        return invalid
+
+    def add_gpx(self, filename, tracks):
+        parent = self.drop_pending(filename)
+        # the same activity from another device or export is only shown once
+        fresh = [(i, t) for i, t in enumerate(tracks) if self.loadedTracks.claim_track(t) is None]
+        if len(fresh) < len(tracks):
+            self.duplicateTracks += len(tracks) - len(fresh)
+            self.update_duplicates_message()
+            if not fresh:
+                self.loadedTracks.release_file(filename)
+                if parent is not None:
+                    self.model.remove(parent)
+                return
+        with profiling.span('add_gpx', file=filename, points=sum(len(t) for _, t in fresh)):
+            if parent is None:
+                parent = self.model.append(None, [filename, None, None])
+            for i, track in fresh:
+                color = Gdk.RGBA(*hsv_to_rgb((i / len(tracks) + 1 / 3) % 1.0, 1.0, 1.0))
+                self.add_track(parent, track, color)
+                self.trackMemory.add(track, filename, i)
         if len(self.model) > 1 or len(tracks) > 1:
             self.wTree.get_object("checkmenuitemShowSidebar").set_active(True)
             self.show_track_selector()
-        else:
+        elif tracks:
             self.select_trace(next(self.model[0].iterchildren()))
-        return track
 
     def open_gpx(self, *args):
         filechooser = Gtk.FileChooserDialog(title=_("Choose a GPX file to Load"), action=Gtk.FileChooserAction.OPEN,
@@ -387,15 +839,114 @@ class MainWindow:
         filechooser.add_button(Gtk.STOCK_OPEN, Gtk.ResponseType.OK)
         filechooser.set_position(Gtk.WindowPosition.CENTER_ON_PARENT)
         filechooser.set_select_multiple(True)
+        gpx_filter = Gtk.FileFilter()
+        gpx_filter.set_name(_("GPX files and archives"))
+        for pattern in archive.PATTERNS:
+            gpx_filter.add_pattern(pattern)
+            gpx_filter.add_pattern(pattern.upper())
+        filechooser.add_filter(gpx_filter)
+        all_filter = Gtk.FileFilter()
+        all_filter.set_name(_("All files"))
+        all_filter.add_pattern("*")
+        filechooser.add_filter(all_filter)
         response = filechooser.run()
 
         if response == Gtk.ResponseType.OK:
-            for filename in filechooser.get_filenames():
-                if self.load_gpx(filename):
-                    self.recent.add_item("file://" + filename)
+            filenames = filechooser.get_filenames()
+            self.recentPending.update(filenames)
+            self.load_files(filenames)
 
         filechooser.destroy()
 
+    def show_library(self, *args):
+        if self.libraryWindow is None:
+            from .library import TrackLibrary
+            from .librarywindow import LibraryWindow
+
+            library = TrackLibrary(os.path.join(GLib.get_user_data_dir(), 'gpxviewer', 'library.sqlite'))
+            self.libraryWindow = LibraryWindow(library, lambda paths: self.load_files(paths, library.bounds(paths)),
+                                               parent=self.mainWindow)
+        self.libraryWindow.show_all()
+        self.libraryWindow.present()
+
+    def show_profile(self, *args):
+        if self.profileWindow is None:
+            from .profilewindow import ProfileWindow
+
+            self.profileWindow = ProfileWindow(parent=self.mainWindow)
+        self.profileWindow.refresh()
+        self.profileWindow.show_all()
+        self.profileWindow.present()
+
+    def seed_tiles(self, *args):
+        if self.tileSeeder:
+            return
+        loaded = [d.track for d in self.get_all_drawings()]
+        if not loaded:
+            return
+
+        dialog = Gtk.Dialog(title=_("Download Map Tiles"), parent=self.mainWindow, modal=True)
+        dialog.add_button(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL)
+        dialog.add_button(_("_Download"), Gtk.ResponseType.OK)
+        grid = Gtk.Grid(row_spacing=6, column_spacing=6, border_width=6)
+        dialog.get_content_area().add(grid)
+        zoom = int(self.map.props.zoom)
+        spins = []
+        for row, (label, value) in enumerate(((_("From zoom:"), zoom), (_("To zoom:"), min(zoom + 3, 17)))):
+            grid.attach(Gtk.Label(label=label, xalign=0), 0, row, 1, 1)
+            spin = Gtk.SpinButton.new_with_range(self.map.props.min_zoom, self.map.props.max_zoom, 1)
+            spin.set_value(value)
+            grid.attach(spin, 1, row, 1, 1)
+            spins.append(spin)
+        count = Gtk.Label(xalign=0)
+        grid.attach(count, 0, 2, 2, 1)
+        tile_set = set()
+
+        def update_count(*args):
+            nonlocal tile_set
+            lo, hi = sorted(int(s.get_value()) for s in spins)
+            tile_set = tiles.corridor_tiles(loaded, lo, hi)
+            too_many = len(tile_set) > tiles.MAX_TILES
+            count.set_text(_("%(count)d tiles along the loaded tracks%(limit)s") % {
+                "count": len(tile_set),
+                "limit": _(", more than the %d allowed") % tiles.MAX_TILES if too_many else ""})
+            dialog.set_response_sensitive(Gtk.ResponseType.OK, not too_many)
+
+        for spin in spins:
+            spin.connect("value-changed", update_count)
+        update_count()
+        dialog.show_all()
+        response = dialog.run()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK:
+            return
+
+        self.tileSeeder = seeder = tiles.TileSeeder(self.tileCache)
+        self.buttonCancelLoad.show()
+
+        def run():
+            result = seeder.seed(tile_set, lambda done, total: GLib.idle_add(self.on_seeding_progress, done, total))
+            self.tileCache.trim()
+            GLib.idle_add(self.on_seeding_done, *result)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def on_seeding_progress(self, done, total):
+        self.statusbar.remove_all(self.statusbarTilesContext)
+        self.statusbar.push(self.statusbarTilesContext,
+                            _("Downloading tile %(done)d of %(total)d...") % {"done": done, "total": total})
+        return False
+
+    def on_seeding_done(self, downloaded, failed):
+        self.tileSeeder = None
+        self.buttonCancelLoad.hide()
+        self.statusbar.remove_all(self.statusbarTilesContext)
+        if failed:
+            self.statusbar.push(self.statusbarTilesContext,
+                                _("%d map tiles could not be downloaded") % failed)
+        self.map.map_redraw_idle()
+        return False
+
     def show_gpx_error(self):
         message_box = Gtk.MessageDialog(parent=self.mainWindow, type=Gtk.MessageType.ERROR, buttons=Gtk.ButtonsType.OK,
                                         message_format=_("You selected an invalid GPX file. \n Please try again"))
@@ -404,6 +955,9 @@ class MainWindow:
         return None
 
     def quit(self, w):
+        self.loader.shutdown()
+        if self.libraryWindow is not None:
+            self.libraryWindow.shutdown()
         Gtk.main_quit()
 
     def main(self):
@@ -451,9 +1005,175 @@ class MainWindow:
     def button_track_add_clicked(self, *args):
         self.open_gpx()
 
-    def remove_track(self, tracks):
-        for t in tracks:
-            self.map.track_remove(t)
+    def remove_track(self, drawing):
+        drawing.remove()
+        self.visibleDrawings.discard(drawing)
+        self.selectedDrawings.discard(drawing)
+        self.detach_track(drawing)
+
+    def detach_track(self, drawing):
+        # takes the track out of everything built from its points, to be
+        # changed and put back with attach_track
+        self.statistics.remove(drawing.track)
+        self.trackIndex.remove(drawing)
+        self.trackMemory.remove(drawing.track)
+        self.loadedTracks.release_track(drawing.track)
+        if self.heatmap is not None:
+            self.heatmapPending.pop(drawing.track, None)
+            self.heatmap.remove(drawing.track)
+            self.map.map_redraw_idle()
+
+    def attach_track(self, drawing, filename, index):
+        self.statistics.add(drawing.track)
+        self.trackIndex.insert(drawing, spatial.segment_boxes(drawing.track))
+        self.trackMemory.add(drawing.track, filename, index)
+        self.loadedTracks.claim_track(drawing.track)
+        if self.heatmap is not None:
+            self.queue_heatmap_add([drawing.track])
+        self.queue_viewport_update()
+
+    def follow_toggled(self, item):
+        self.stop_following()
+        if not item.get_active():
+            return
+        model, _iter = self.tv.get_selection().get_selected()
+        if _iter is not None and self.model.iter_parent(_iter) is not None:
+            _iter = self.model.iter_parent(_iter)
+        filename = self.model.get_value(_iter, self.NAME_IDX) if _iter is not None else None
+        if filename is None or self.is_pending_row(_iter) or not can_follow(filename):
+            item.set_active(False)
+            self.statusbar.push(self.statusbarFollowContext,
+                                _("Select a loaded GPX file that isn't compressed to follow it"))
+            return
+        self.followRow = Gtk.TreeRowReference.new(self.model, self.model.get_path(_iter))
+        self.statusbar.push(self.statusbarFollowContext, _("Following %s") % filename)
+        # the whole file is read once in a worker, only what is appended
+        # after that is parsed here
+        loaded = {index: self.trackMemory.point_counts(drawing.track)
+                  for index, drawing in self.followed_drawings().items()}
+        self.loader.call(functools.partial(self.on_follow_started, self.followRow),
+                         start_following, filename, loaded)
+
+    def on_follow_started(self, row, result):
+        if row is not self.followRow:
+            # stopped, or following another file, since
+            return
+        if result is None:
+            self.wTree.get_object("checkmenuitemFollow").set_active(False)
+            self.statusbar.push(self.statusbarFollowContext, _("Stopped following, the file couldn't be read"))
+            return
+        self.follower, self.followChunks = result
+        self.followSeen.update(range(self.follower.tracks))
+        if self.poll_follower():
+            self.followId = GLib.timeout_add_seconds(FOLLOW_INTERVAL_S, self.poll_follower)
+
+    def stop_following(self):
+        if self.followId is not None:
+            GLib.source_remove(self.followId)
+        self.follower = self.followRow = self.followId = self.followChunks = None
+        self.followSeen.clear()
+        self.statusbar.remove_all(self.statusbarFollowContext)
+
+    def followed_drawings(self):
+        # index in the followed file -> TrackDrawing, for the tracks shown
+        if self.followRow is None or not self.followRow.valid():
+            return {}
+        drawings = {}
+        for child in self.model[self.followRow.get_path()].iterchildren():
+            source = self.trackMemory.source(child[self.GPX_IDX])
+            if source is not None:
+                drawings[source[1]] = child[self.OSM_IDX]
+        return drawings
+
+    def poll_follower(self):
+        first = self.followChunks is not None
+        drawings = self.followed_drawings()
+        message = None
+        if not self.followRow.valid():
+            message = _("Stopped following, the file was removed")
+        elif any(not self.trackMemory.need(d.track) and not self.trackMemory.is_lost(d.track)
+                 for d in drawings.values()):
+            # what was appended to an evicted track waits for the rest of
+            # its points, being reloaded
+            return True
+        elif first:
+            chunks, self.followChunks = self.followChunks, None
+        else:
+            try:
+                chunks = self.follower.poll()
+            except (GPXReadError, EnvironmentError) as e:
+                message = _("Stopped following: %s") % e
+        if message is not None:
+            # the source goes away with the False returned
+            self.followId = None
+            self.wTree.get_object("checkmenuitemFollow").set_active(False)
+            self.statusbar.push(self.statusbarFollowContext, message)
+            return False
+        if not chunks:
+            return True
+
+        with profiling.span('follow', points=sum(len(c[3]) for c in chunks)):
+            latest = self.add_followed(chunks, drawings, first)
+        if latest is None:
+            return True
+        model, _iter = self.tv.get_selection().get_selected()
+        selected = self.model.get_value(_iter, self.GPX_IDX) if _iter is not None else None
+        if selected is not None and selected in {d.track for d in drawings.values()}:
+            self.show_summary(selected.summary)
+        if self.wTree.get_object("checkmenuitemFollowCenter").get_active():
+            self.map.set_center(*latest)
+        self.trim_memory()
+        return True
+
+    def add_followed(self, chunks, drawings, first):
+        # appends the points of GPXFollower.poll() to the tracks they
+        # belong to and returns the latest position, or None if all of
+        # them were there already. The first chunks, from start_following,
+        # are what the file has grown by since it was loaded. Tracks met
+        # before that aren't shown, left out as duplicates or deleted, stay out
+        filename = self.follower.filename
+        changed = {}
+        new = {}
+        latest = None
+        for index, si, start, lat, lon, ele, time in chunks:
+            known = index in self.followSeen
+            self.followSeen.add(index)
+            drawing = drawings.get(index)
+            if drawing is not None:
+                track = drawing.track
+                if drawing not in changed:
+                    # evicted tracks would have the points added to their coarse polyline
+                    if not self.trackMemory.need(track):
+                        continue
+                segments = track.segments
+                if si > len(segments):
+                    continue
+                skip = len(segments[si]) - start if si < len(segments) else 0
+                if skip >= len(lat):
+                    continue
+                if drawing not in changed:
+                    self.detach_track(drawing)
+                    changed[drawing] = (index, [])
+                changed[drawing][1].append((si, track.extend(si, lat[skip:], lon[skip:], ele[skip:], time[skip:])))
+            elif first or known and index not in new:
+                continue
+            else:
+                track = new.setdefault(index, Track(self.follower.names.get(index)))
+                track.extend(si, lat, lon, ele, time)
+            latest = lat[-1], lon[-1]
+
+        for drawing, (index, extended) in changed.items():
+            self.attach_track(drawing, filename, index)
+            for si, start in extended:
+                drawing.extend(si, start)
+        if new:
+            parent = self.model.get_iter(self.followRow.get_path())
+            for index, track in new.items():
+                color = Gdk.RGBA(*hsv_to_rgb((index / (index + 1) + 1 / 3) % 1.0, 1.0, 1.0))
+                self.add_track(parent, track, color)
+                self.trackMemory.add(track, filename, index)
+                self.loadedTracks.claim_track(track)
+        return latest
 
     def button_track_delete_clicked(self, *args):
         model, _iter = self.tv.get_selection().get_selected()
@@ -461,27 +1181,63 @@ class MainWindow:
             return
         if self.model.get_value(_iter, self.OSM_IDX):
             self.remove_track(self.model.get_value(_iter, self.OSM_IDX))
+        elif self.is_pending_row(_iter):
+            filename = self.model.get_value(_iter, self.NAME_IDX)
+            self.loader.cancel_files([filename])
+            self.loadedTracks.release_file(filename)
+            self.drop_pending(filename)
         else:
             for child in self.model[_iter].iterchildren():
                 self.remove_track(child[self.OSM_IDX])
+            self.loadedTracks.release_file(self.model.get_value(_iter, self.NAME_IDX))
         self.model.remove(_iter)
 
     def button_track_properties_clicked(self, *args):
         model, _iter = self.tv.get_selection().get_selected()
         if _iter:
-            OsmGpsMapTracks = self.model.get_value(_iter, self.OSM_IDX)
+            drawing = self.model.get_value(_iter, self.OSM_IDX)
+            if not drawing:
+                return
             colorseldlg = Gtk.ColorSelectionDialog("Select track color")
-            colorseldlg.get_color_selection().set_current_color(OsmGpsMapTracks[0].props.color.to_color())
+            colorseldlg.get_color_selection().set_current_color(drawing.color.to_color())
             result = colorseldlg.run()
             if result == Gtk.ResponseType.OK:
                 color = colorseldlg.get_color_selection().get_current_rgba()
-                for OsmGpsMapTrack in OsmGpsMapTracks:
-                    OsmGpsMapTrack.set_color(color)
-                    self.map.map_redraw()
+                drawing.set_color(color)
+                self.map.map_redraw_idle()
             colorseldlg.destroy()
 
     def button_track_inspect_clicked(self, *args):
-        pass
+        model, _iter = self.tv.get_selection().get_selected()
+        if not _iter:
+            return
+        drawing = self.model.get_value(_iter, self.OSM_IDX)
+        if not drawing:
+            return
+        # the profiles use every point, not just those kept for an evicted
+        # track; they are reloaded in the background and it opens after
+        if self.trackMemory.need(drawing.track):
+            self.inspectPending = None
+            self.inspect_track(drawing)
+        elif self.trackMemory.is_lost(drawing.track):
+            self.show_gpx_error()
+        else:
+            self.inspectPending = drawing
+
+    def inspect_track(self, drawing):
+        # like the statistics window, it needs matplotlib
+        from .inspectwindow import InspectWindow
+
+        InspectWindow(drawing.track, self.set_marker, parent=self.mainWindow).show_all()
+
+    def set_marker(self, lat, lon):
+        if self.markerLayer is None:
+            if lat is None:
+                return
+            self.markerLayer = MarkerLayer()
+            self.map.layer_add(self.markerLayer)
+        if self.markerLayer.set_position(lat, lon):
+            self.map.map_redraw_idle()
 
 
 class MapZoomSlider(Gtk.HBox):
@@ -26,23 +26,30 @@ parent_dir = os.path.dirname(os.path.abspath(__file__))
 source_dir = os.path.join(parent_dir, "gpxviewer")
 sys.path.append(source_dir)
 
-import gi
-gi.require_version('Gdk', '3.0')
-
-from gi.repository import Gdk
-from gpxviewer.ui import MainWindow
-
-if len(sys.argv) > 2:
-	files = sys.argv[1:]
-elif len(sys.argv) > 1:
-	files = [sys.argv[1]]
-else:
+# guarded so that worker processes started by the loader don't open a window,
+# or pay for importing the UI
+if __name__ == "__main__":
 	files = []
-
-ui_dir = os.path.join(parent_dir, "ui/")
-
-gui = MainWindow(
-		ui_dir=ui_dir,
-		files=files
-).main()
+	for arg in sys.argv[1:]:
+		# --profile[=FILE] turns on the timing spans, see gpxviewer/profiling.py
+		if arg == "--profile" or arg.startswith("--profile="):
+			os.environ["GPXVIEWER_PROFILE"] = arg.partition("=")[2] or "1"
+		else:
+			# GPX files, gzip, bzip2 or xz compressed or not, zip and tar
+			# archives of them, and single members as archive.zip/walk.gpx,
+			# see gpxviewer/archive.py
+			files.append(arg)
+
+	import gi
+	gi.require_version('Gdk', '3.0')
+
+	from gi.repository import Gdk
+	from gpxviewer.ui import MainWindow
+
+	ui_dir = os.path.join(parent_dir, "ui/")
+
+	gui = MainWindow(
+			ui_dir=ui_dir,
+			files=files
+	).main()
 
@@ -15,12 +15,12 @@ setup(name="gpxviewer",
 	license="GNU General Public License (GPL)",
 	platforms="linux",
 	packages=["gpxviewer"],
-	install_requires=['PyGObject', 'pycairo', 'matplotlib', 'gpxpy'],
+	install_requires=['PyGObject', 'pycairo', 'matplotlib', 'gpxpy', 'numpy'],
 	data_files=[
 		('share/gpxviewer/ui/', ['ui/gpxviewer.ui', 'ui/gpxviewer.png', 'ui/gpxviewer.svg']),
 		('share/pixmaps', ['ui/gpxviewer.svg']) 
 	],
-	scripts = ['bin/gpxviewer'],
+	scripts = ['bin/gpxviewer', 'bin/gpxviewer-stats'],
       cmdclass = { "build" :  build_extra.build_extra,
                    "build_i18n" :  build_i18n.build_i18n,
                  }